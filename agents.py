@@ -3,11 +3,14 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from crewai import Agent, LLM
-from tools import search_tool, read_financial_document
+from crewai import Agent
+from llm_cache import CachedLLM
+from tools import search_tool, read_financial_document, search_financial_document
 
 ### Loading LLM — configure via GOOGLE_API_KEY env var
-llm = LLM(
+# Responses are cached on (model, prompt, params); see LLM_CACHE_MODE for offline replay.
+# Provider calls share one quota across all agents and workers (LLM_RPM) instead of per-agent max_rpm.
+llm = CachedLLM(
     model="gemini/gemini-2.0-flash",
     api_key=os.getenv("GOOGLE_API_KEY"),
 )
@@ -26,10 +29,9 @@ financial_analyst = Agent(
         "and base your analysis strictly on the data presented. You never fabricate information and always "
         "cite specific figures from the documents you analyze."
     ),
-    tools=[read_financial_document, search_tool],
+    tools=[search_financial_document, read_financial_document, search_tool],
     llm=llm,
     max_iter=5,
-    max_rpm=3,
     allow_delegation=False,
 )
 
@@ -51,7 +53,6 @@ verifier = Agent(
     tools=[read_financial_document],
     llm=llm,
     max_iter=5,
-    max_rpm=3,
     allow_delegation=False,
 )
 
@@ -70,10 +71,9 @@ investment_advisor = Agent(
         "and aligned with regulatory standards. You never recommend products without proper due diligence "
         "and always disclose potential risks alongside opportunities."
     ),
-    tools=[read_financial_document, search_tool],
+    tools=[search_financial_document, search_tool],
     llm=llm,
     max_iter=5,
-    max_rpm=3,
     allow_delegation=False,
 )
 
@@ -91,9 +91,8 @@ risk_assessor = Agent(
         "quantitative risk modeling. You assess risks objectively based on data, assign appropriate risk "
         "ratings, and recommend mitigation strategies grounded in industry best practices."
     ),
-    tools=[read_financial_document, search_tool],
+    tools=[search_financial_document, search_tool],
     llm=llm,
     max_iter=5,
-    max_rpm=3,
     allow_delegation=False,
 )
@@ -0,0 +1,125 @@
+## Offline stand-ins for the LLM, web search and Celery broker
+import re
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from crewai.llms.base_llm import BaseLLM
+from crewai.tools import BaseTool
+
+from metrics import current_job, current_priority, job_metrics
+from rate_limiter import llm_rate_limiter
+
+_FILE_PATH_RE = re.compile(r"data/financial_document_[0-9a-fA-F-]{36}\.pdf")
+
+
+class FakeLLM(BaseLLM):
+    """
+    Deterministic ReAct-speaking LLM with a configurable per-call delay.
+
+    With `tool_rounds` > 0 it first asks for the document search tool that many
+    times before giving a final answer, so tool latency shows up in the timings.
+    Calls pass through the shared LLM rate limiter like real provider calls
+    (it admits everything when LLM_RPM is 0).
+    """
+
+    def __init__(self, delay: float = 0.0, tool_rounds: int = 1):
+        super().__init__(model="fake/benchmark-llm", temperature=0.0)
+        self.delay = delay
+        self.tool_rounds = tool_rounds
+        # Agents hold shallow copies of their LLM; a shared dict keeps one count across them
+        self._counts = {"calls": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def calls(self) -> int:
+        return self._counts["calls"]
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        with self._lock:
+            self._counts["calls"] += 1
+        wait = llm_rate_limiter.acquire(job_id=current_job.get(), priority=current_priority.get())
+        if wait:
+            job_metrics.record("throttle", "llm_rate_limiter", wait)
+        if self.delay:
+            time.sleep(self.delay)
+
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        text = "\n".join(str(m.get("content", "")) for m in messages)
+        # Prompts describe the ReAct format too; only count observations from earlier turns
+        observations = sum(
+            str(m.get("content", "")).count("Observation:")
+            for m in messages if m.get("role") == "assistant"
+        )
+        match = _FILE_PATH_RE.search(text)
+        if match and observations < self.tool_rounds:
+            # crewai's @tool schema marks every argument as required, defaults included
+            action_input = json.dumps({"query": "total revenues net income", "file_path": match.group(0), "top_k": 5})
+            return (
+                "Thought: I should look up the key figures in the document.\n"
+                "Action: Financial Document Search\n"
+                f"Action Input: {action_input}"
+            )
+        return (
+            "Thought: I now can give a great answer\n"
+            "Final Answer: Document type: quarterly update. Legitimacy: PASS. "
+            "Revenue and margins were reviewed; risk rating Medium."
+        )
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def supports_stop_words(self) -> bool:
+        return True
+
+    def get_context_window_size(self) -> int:
+        return 1_000_000
+
+
+class FakeSearchTool(BaseTool):
+    """Drop-in for SerperDevTool that returns canned results after a delay."""
+
+    name: str = "Search the internet with Serper"
+    description: str = "Searches the internet for a query and returns the top results."
+    delay: float = 0.0
+
+    def _run(self, search_query: str = "", **kwargs) -> str:
+        if self.delay:
+            time.sleep(self.delay)
+        return json.dumps({
+            "searchParameters": {"q": search_query},
+            "organic": [
+                {"title": f"{search_query} - analyst coverage", "link": "https://example.com/a",
+                 "snippet": "Consensus rating: Hold. Average price target unchanged."},
+            ],
+        })
+
+
+class InMemoryQueue:
+    """
+    Broker stand-in: runs Celery tasks eagerly on a local thread pool.
+
+    `enqueue` mirrors `.delay()` and returns immediately; the queue wait is
+    recorded per job so it shows up next to the stage timings.
+    """
+
+    def __init__(self, workers: int):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bench-worker")
+        self._futures = []
+        self.queue_wait = {}
+
+    def enqueue(self, task, *args):
+        enqueued = time.perf_counter()
+
+        def run():
+            self.queue_wait[args[0]] = time.perf_counter() - enqueued
+            return task.apply(args=args)
+
+        self._futures.append(self._pool.submit(run))
+
+    def drain(self):
+        for future in self._futures:
+            future.result()
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,153 @@
+"""
+Import-time and startup benchmark for the API and worker processes.
+
+Each target is measured in a fresh interpreter: wall time to import its
+module, peak RSS, the number of modules loaded and which agent-stack
+packages came with them. For the API it also times the startup hook plus
+a first request.
+
+    python -m benchmarks.import_cost
+    python -m benchmarks.import_cost --repeat 5 --compare benchmarks/results/imports-<sha>.json
+
+Exits non-zero when the API process imports any of AGENT_STACK, so it can
+guard the split between the API and the worker in CI.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+from benchmarks.run_benchmark import RESULTS_DIR, _git_commit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Top-level packages only the worker should load
+AGENT_STACK = (
+    "crewai", "crewai_tools", "litellm", "langchain", "langchain_core", "langchain_community",
+    "openai", "chromadb", "worker", "agents", "task", "tools", "llm_cache",
+)
+
+TARGETS = {
+    "api": "main",
+    "worker": "worker",
+}
+
+# Runs in the child interpreter: argv[1] is the module to import
+_PROBE = """
+import sys, time, json, resource, importlib
+started = time.perf_counter()
+result = {}
+try:
+    module = importlib.import_module(sys.argv[1])
+except Exception as exc:
+    result["error"] = f"{type(exc).__name__}: {exc}"
+    module = None
+result["import_s"] = time.perf_counter() - started
+
+if module is not None and hasattr(module, "app") and hasattr(module.app, "router"):
+    import asyncio
+    import httpx
+
+    async def first_request():
+        started = time.perf_counter()
+        for handler in module.app.router.on_startup:
+            await handler()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=module.app), base_url="http://bench") as client:
+            (await client.get("/")).raise_for_status()
+        return time.perf_counter() - started
+
+    result["startup_s"] = asyncio.run(first_request())
+
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+result["peak_rss_mb"] = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+result["modules"] = len(sys.modules)
+result["top_level"] = sorted({name.split(".")[0] for name in sys.modules})
+print(json.dumps(result))
+"""
+
+
+def _probe(module: str, workdir: str) -> dict:
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])),
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'imports.db')}",
+        REDIS_URL="memory://",
+        RATE_LIMIT_PATH=os.path.join(workdir, "rate_limiter.db"),
+        WARM_WORKERS="false",
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", _PROBE, module], cwd=workdir, env=env, capture_output=True, text=True,
+    )
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        return {"error": (completed.stderr.strip().splitlines() or ["no output"])[-1]}
+    return json.loads(lines[-1])
+
+
+def _measure(module: str, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix="fda-imports-") as workdir:
+            runs.append(_probe(module, workdir))
+    last = runs[-1]
+    summary = {
+        "module": module,
+        "modules": last.get("modules"),
+        "agent_stack": sorted(set(last.get("top_level", ())) & set(AGENT_STACK)),
+    }
+    if "error" in last:
+        summary["error"] = last["error"]
+    for key in ("import_s", "startup_s", "peak_rss_mb"):
+        samples = [run[key] for run in runs if key in run]
+        if samples:
+            summary[key] = round(statistics.median(samples), 3)
+    return summary
+
+
+def _compare(current: dict, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nvs. {baseline['meta']['commit']} ({baseline_path})")
+    for target, now in current["targets"].items():
+        before = baseline["targets"].get(target, {})
+        for key in ("import_s", "startup_s", "peak_rss_mb", "modules"):
+            if key in now and key in before:
+                print(f"  {target:<7} {key:<12} {before[key]:>10} -> {now[key]:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per target (median is reported)")
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=sorted(TARGETS))
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/imports-<commit>.json)")
+    parser.add_argument("--compare", help="Baseline result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    summary = {
+        "meta": {"commit": _git_commit(), "timestamp": datetime.utcnow().isoformat(), "repeat": args.repeat},
+        "targets": {target: _measure(TARGETS[target], args.repeat) for target in args.targets},
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"imports-{summary['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(summary, f, indent=2)
+
+    print(json.dumps(summary["targets"], indent=2))
+    print(f"\nResults written to {output}")
+    if args.compare:
+        _compare(summary, args.compare)
+
+    api = summary["targets"].get("api")
+    if api and (api.get("agent_stack") or "error" in api):
+        print(f"\nAPI process is not lean: {api.get('error') or ', '.join(api['agent_stack'])}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""
+End-to-end benchmark: drives main.app over ASGI with concurrent /analyze,
+/status, /results and /history traffic while jobs run eagerly on a local
+thread pool against a fake LLM and fake web search.
+
+    python -m benchmarks.run_benchmark --jobs 20 --concurrency 5 --llm-delay 0.2
+    python -m benchmarks.run_benchmark --compare benchmarks/results/bench-<sha>.json
+
+Results (latency percentiles, jobs/minute, peak RSS, per-stage time) are
+written as JSON so runs from different commits can be compared.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import asyncio
+import tempfile
+import resource
+import statistics
+import subprocess
+from collections import defaultdict
+from datetime import datetime
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+PAGE_COUNTS = (4, 20, 60, 150)
+
+
+def _configure_environment(workdir: str, args):
+    """Point every backing service at local, in-process stand-ins before the app is imported."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["REDIS_URL"] = "memory://"
+    os.environ["EXTRACTION_CACHE_DIR"] = os.path.join(workdir, "extracted")
+    os.environ["LLM_CACHE_MODE"] = "off"
+    os.environ["LLM_RPM"] = str(args.llm_rpm)
+    os.environ["WARM_WORKERS"] = "false" if args.cold_workers else "true"
+    os.environ["RATE_LIMIT_PATH"] = os.path.join(workdir, "rate_limiter.db")
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ.setdefault("SERPER_API_KEY", "benchmark")
+    os.environ["CREWAI_DISABLE_TELEMETRY"] = "true"
+    os.environ["OTEL_SDK_DISABLED"] = "true"
+
+
+def _install_fakes(args):
+    """Swap the agents' LLM and web search for fakes and route enqueues to a local pool."""
+    import agents
+    import task
+    import main
+    import tools
+    import worker
+    from benchmarks.fakes import FakeLLM, FakeSearchTool, InMemoryQueue
+
+    fake_llm = FakeLLM(delay=args.llm_delay, tool_rounds=args.tool_rounds)
+    fake_search = FakeSearchTool(delay=args.search_delay)
+
+    for agent in (agents.verifier, agents.financial_analyst, agents.investment_advisor, agents.risk_assessor):
+        agent.llm = fake_llm
+        agent.tools = [fake_search if t is tools.search_tool else t for t in agent.tools]
+    for t in (task.verification, task.analyze_financial_document, task.investment_analysis, task.risk_assessment):
+        t.tools = [fake_search if tool is tools.search_tool else tool for tool in t.tools]
+
+    # REDIS_URL is "memory://", which is a broker transport but not a result backend
+    worker.celery_app.conf.update(
+        task_always_eager=True, task_eager_propagates=False, result_backend="cache+memory://",
+    )
+    queue = InMemoryQueue(workers=args.workers)
+
+    # The API enqueues by task name; route those sends to the local pool instead of the broker
+    main.enqueue_analysis = lambda *task_args: queue.enqueue(worker.process_financial_document_task, *task_args)
+    return main.app, queue, fake_llm
+
+
+def _percentiles(samples: list) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "p50_ms": round(pct(50) * 1000, 2),
+        "p95_ms": round(pct(95) * 1000, 2),
+        "p99_ms": round(pct(99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+    }
+
+
+async def _client(client, job_index: int, args, pdfs: dict, latencies: dict, job_results: list):
+    async def timed(kind, coro):
+        start = time.perf_counter()
+        response = await coro
+        latencies[kind].append(time.perf_counter() - start)
+        return response
+
+    pages = PAGE_COUNTS[job_index % len(PAGE_COUNTS)]
+    submitted = time.perf_counter()
+    response = await timed("analyze", client.post(
+        "/analyze",
+        files={"file": (f"bench-{job_index}.pdf", pdfs[pages], "application/pdf")},
+        data={"query": "Summarise revenue trends and key risks", "force_refresh": "true"},
+    ))
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+
+    status = {}
+    while True:
+        status = (await timed("status", client.get(f"/status/{job_id}"))).json()
+        if status.get("status") in ("completed", "failed"):
+            break
+        if random.random() < 0.2:
+            await timed("history", client.get("/history", params={"limit": 10}))
+        await asyncio.sleep(args.poll_interval)
+
+    await timed("results", client.get(f"/results/{job_id}"))
+    job_results.append({
+        "job_id": job_id,
+        "pages": pages,
+        "status": status.get("status"),
+        "latency_s": time.perf_counter() - submitted,
+        "stage_timings": status.get("stage_timings") or {},
+        "crew_setup_s": ((status.get("metrics") or {}).get("steps") or {}).get("crew_setup"),
+    })
+
+
+async def _drive(app, args, pdfs: dict):
+    import httpx
+
+    latencies = defaultdict(list)
+    job_results = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def bounded(i):
+        async with semaphore:
+            await _client(client, i, args, pdfs, latencies, job_results)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(bounded(i) for i in range(args.jobs)))
+        wall = time.perf_counter() - start
+    return latencies, job_results, wall
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), text=True,
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def _summarise(args, latencies, job_results, wall, queue, fake_llm) -> dict:
+    stage_samples = defaultdict(list)
+    for job in job_results:
+        for stage, secs in job["stage_timings"].get("stages", {}).items():
+            stage_samples[stage].append(secs)
+        if "wall_seconds" in job["stage_timings"]:
+            stage_samples["crew_wall"].append(job["stage_timings"]["wall_seconds"])
+    stage_samples["queue_wait"] = list(queue.queue_wait.values())
+    stage_samples["crew_setup"] = [j["crew_setup_s"] for j in job_results if j["crew_setup_s"] is not None]
+
+    completed = [j for j in job_results if j["status"] == "completed"]
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "args": vars(args),
+        },
+        "endpoints": {kind: _percentiles(samples) for kind, samples in sorted(latencies.items())},
+        "jobs": {
+            "submitted": len(job_results),
+            "completed": len(completed),
+            "failed": len(job_results) - len(completed),
+            "wall_seconds": round(wall, 3),
+            "jobs_per_minute": round(len(completed) / wall * 60, 2) if wall else 0.0,
+            "latency": _percentiles([j["latency_s"] for j in job_results]),
+            "llm_calls": fake_llm.calls,
+        },
+        "stages": {
+            stage: {"mean_s": round(statistics.fmean(v), 4), "max_s": round(max(v), 4)}
+            for stage, v in sorted(stage_samples.items()) if v
+        },
+        "peak_rss_mb": round(peak_rss_mb, 1),
+    }
+
+
+def _compare(current: dict, baseline_path: str):
+    """Print current vs. baseline for the headline numbers (ratio > 1 means slower/larger)."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    rows = [("jobs_per_minute", ("jobs", "jobs_per_minute")), ("peak_rss_mb", ("peak_rss_mb",))]
+    for kind in sorted(set(current["endpoints"]) | set(baseline["endpoints"])):
+        for p in ("p50_ms", "p95_ms", "p99_ms"):
+            rows.append((f"{kind}.{p}", ("endpoints", kind, p)))
+    for p in ("p50_ms", "p95_ms"):
+        rows.append((f"job.{p}", ("jobs", "latency", p)))
+
+    def dig(data, path):
+        for key in path:
+            if not isinstance(data, dict) or key not in data:
+                return None
+            data = data[key]
+        return data
+
+    print(f"\n{'metric':<24}{'baseline':>12}{'current':>12}{'ratio':>8}")
+    for label, path in rows:
+        old, new = dig(baseline, path), dig(current, path)
+        ratio = f"{new / old:.2f}" if old and new is not None else "-"
+        print(f"{label:<24}{str(old):>12}{str(new):>12}{ratio:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=12, help="Number of documents to submit")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent API clients")
+    parser.add_argument("--workers", type=int, default=2, help="Local worker threads (stand-in for Celery)")
+    parser.add_argument("--llm-delay", type=float, default=0.05, help="Seconds per fake LLM call")
+    parser.add_argument("--search-delay", type=float, default=0.05, help="Seconds per fake web search")
+    parser.add_argument("--tool-rounds", type=int, default=1, help="Document-search calls per task before answering")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="Seconds between /status polls")
+    parser.add_argument("--llm-rpm", type=float, default=0,
+                        help="Route fake LLM calls through the shared rate limiter at this rate (0 = unlimited)")
+    parser.add_argument("--cold-workers", action="store_true",
+                        help="Build the crews for every job instead of reusing warm ones (WARM_WORKERS=false)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/bench-<commit>.json)")
+    parser.add_argument("--compare", help="Baseline result JSON to compare against")
+    args = parser.parse_args(argv)
+    random.seed(args.seed)
+
+    workdir = tempfile.mkdtemp(prefix="fda-bench-")
+    _configure_environment(workdir, args)
+    # Uploads land in ./data relative to the working directory
+    os.chdir(workdir)
+
+    from benchmarks.synthetic_pdf import make_financial_pdf
+    import database
+
+    app, queue, fake_llm = _install_fakes(args)
+    database.create_tables()
+    pdfs = {pages: make_financial_pdf(pages, seed=args.seed + pages) for pages in PAGE_COUNTS}
+
+    latencies, job_results, wall = asyncio.run(_drive(app, args, pdfs))
+    queue.drain()
+    summary = _summarise(args, latencies, job_results, wall, queue, fake_llm)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{summary['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(summary, f, indent=2)
+
+    print(json.dumps({k: summary[k] for k in ("endpoints", "jobs", "stages", "peak_rss_mb")}, indent=2))
+    print(f"\nResults written to {output}")
+    if args.compare:
+        _compare(summary, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+## Synthetic financial PDFs for benchmarking (no external dependencies)
+import random
+
+_SUMMARY = [
+    "F I N A N C I A L   S U M M A R Y",
+    "($ in millions, except percentages and per share data) Q2-2024 Q3-2024 Q4-2024 Q1-2025 Q2-2025 YoY",
+    "Total revenues {r0:,} {r1:,} {r2:,} {r3:,} {r4:,} {ry}%",
+    "Total gross profit {g0:,} {g1:,} {g2:,} {g3:,} {g4:,} {gy}%",
+    "Income from operations {o0:,} {o1:,} {o2:,} {o3:,} {o4:,} {oy}%",
+    "Net income attributable to common stockholders (GAAP) {n0:,} {n1:,} {n2:,} {n3:,} {n4:,} {ny}%",
+    "Net cash provided by operating activities {c0:,} {c1:,} {c2:,} {c3:,} {c4:,} {cy}%",
+    "Capital expenditures ({x0:,}) ({x1:,}) ({x2:,}) ({x3:,}) ({x4:,}) 5%",
+]
+_BALANCE = [
+    "CONSOLIDATED BALANCE SHEETS",
+    "(in millions) June 30, 2025 December 31, 2024",
+    "Cash and cash equivalents {cash0:,} {cash1:,}",
+    "Total assets {a0:,} {a1:,}",
+    "Total liabilities {l0:,} {l1:,}",
+    "Total stockholders' equity {e0:,} {e1:,}",
+]
+_NARRATIVE = [
+    "Revenue growth was driven by higher deliveries and services revenue in the quarter.",
+    "Operating expenses increased due to research and development for new products.",
+    "Liquidity remains strong with ample cash and short-term investments on hand.",
+    "Risk factors include supply chain disruption, pricing pressure and regulatory change.",
+    "Management continues to invest in capacity expansion and cost reduction programs.",
+    "Foreign exchange movements had an unfavourable impact on reported results.",
+]
+_HEADER = "ACME Motors Q2 2025 Update"
+_FOOTER = "This document contains forward-looking statements that involve risks and uncertainties."
+
+
+def _figures(rng: random.Random) -> dict:
+    base = rng.randint(18_000, 26_000)
+    revenue = [base + rng.randint(-2_000, 2_000) for _ in range(5)]
+    values = {}
+    for i, r in enumerate(revenue):
+        values[f"r{i}"] = r
+        values[f"g{i}"] = int(r * rng.uniform(0.15, 0.2))
+        values[f"o{i}"] = int(r * rng.uniform(0.02, 0.1))
+        values[f"n{i}"] = int(r * rng.uniform(0.02, 0.09))
+        values[f"c{i}"] = int(r * rng.uniform(0.1, 0.25))
+        values[f"x{i}"] = int(r * rng.uniform(0.06, 0.14))
+    for key in "rgonc":
+        values[f"{key}y"] = round((values[f"{key}4"] / values[f"{key}0"] - 1) * 100)
+    for i in range(2):
+        values[f"cash{i}"] = rng.randint(15_000, 37_000)
+        values[f"a{i}"] = rng.randint(110_000, 130_000)
+        values[f"l{i}"] = rng.randint(40_000, 50_000)
+        values[f"e{i}"] = values[f"a{i}"] - values[f"l{i}"]
+    return values
+
+
+def _page_lines(page_no: int, pages: int, figures: dict, rng: random.Random) -> list:
+    lines = [_HEADER]
+    if page_no == 1:
+        lines += [line.format(**figures) for line in _SUMMARY]
+    elif page_no == 2:
+        lines += [line.format(**figures) for line in _BALANCE]
+    else:
+        lines += [rng.choice(_NARRATIVE) for _ in range(30)]
+    lines += [_FOOTER, f"Page {page_no} of {pages}"]
+    return lines
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_financial_pdf(pages: int, seed: int = 0) -> bytes:
+    """Build a valid `pages`-page PDF that looks like a quarterly financial update."""
+    rng = random.Random(seed)
+    figures = _figures(rng)
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(pages)), pages)).encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i in range(pages):
+        objects.append((
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        ).encode())
+        ops = ["BT", "/F1 9 Tf", "12 TL", "40 760 Td"]
+        ops += [f"({_escape(line)}) Tj T*" for line in _page_lines(i + 1, pages, figures, rng)]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
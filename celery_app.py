@@ -0,0 +1,40 @@
+## Celery app and task client, shared by the API and the worker
+# Kept free of crewai/agent imports so the API process can enqueue jobs by
+# task name without loading the analysis stack.
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+from celery import Celery
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Registered by worker.py; the API only refers to it by name
+PROCESS_DOCUMENT_TASK = "process_financial_document"
+
+celery_app = Celery(
+    "financial_analyzer",
+    broker=REDIS_URL,
+    backend=REDIS_URL,
+)
+
+celery_app.conf.update(
+    task_serializer="json",
+    accept_content=["json"],
+    result_serializer="json",
+    timezone="UTC",
+    enable_utc=True,
+    # Retry failed tasks up to 3 times with exponential back-off
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+)
+
+
+def analysis_signature(job_id: str, query: str, file_path: str, priority: int = 0, force_refresh: bool = False):
+    """Signature of the document-analysis task, for grouping several jobs into one publish."""
+    return celery_app.signature(PROCESS_DOCUMENT_TASK, args=(job_id, query, file_path, priority, force_refresh))
+
+
+def enqueue_analysis(job_id: str, query: str, file_path: str, priority: int = 0, force_refresh: bool = False):
+    """Push one document-analysis job onto the queue (non-blocking)."""
+    return celery_app.send_task(PROCESS_DOCUMENT_TASK, args=(job_id, query, file_path, priority, force_refresh))
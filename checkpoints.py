@@ -0,0 +1,82 @@
+## Per-stage checkpoints, so a retried job resumes instead of rerunning the crew
+import logging
+
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal, StageCheckpoint
+
+logger = logging.getLogger(__name__)
+
+
+class StageCheckpoints:
+    """
+    Completed stage outputs of one job, stored as each stage finishes.
+
+    Checkpoints are bound to the document and query hashes they were produced
+    from; `load` ignores (and deletes) any that do not match the current
+    input, so a stale output is never fed into a different analysis.
+    """
+
+    def __init__(self, job_id: str, document_hash: str, query_hash: str):
+        self.job_id = job_id
+        self.document_hash = document_hash
+        self.query_hash = query_hash
+
+    def load(self) -> dict:
+        """Return `{stage name: output}` for the stages this job already completed."""
+        db = SessionLocal()
+        try:
+            rows = db.query(StageCheckpoint).filter(StageCheckpoint.job_id == self.job_id).all()
+            outputs, stale = {}, []
+            for row in rows:
+                if (row.document_hash, row.query_hash) == (self.document_hash, self.query_hash):
+                    outputs[row.stage] = row.output
+                else:
+                    stale.append(row)
+            if stale:
+                logger.warning("Job %s: discarding %d checkpoints for a different input", self.job_id, len(stale))
+                for row in stale:
+                    db.delete(row)
+                db.commit()
+            return outputs
+        finally:
+            db.close()
+
+    def save(self, stage: str, output: str, seconds: float):
+        """
+        Persist one stage's output. Never raises: a lost checkpoint only
+        means the stage is rerun if the job is retried.
+        """
+        db = SessionLocal()
+        values = {
+            "document_hash": self.document_hash, "query_hash": self.query_hash,
+            "output": output, "duration_ms": seconds * 1000,
+        }
+        try:
+            try:
+                db.add(StageCheckpoint(job_id=self.job_id, stage=stage, **values))
+                db.commit()
+            except IntegrityError:
+                # Another attempt of this job (e.g. a redelivered message) saved the stage first
+                db.rollback()
+                db.query(StageCheckpoint).filter(
+                    StageCheckpoint.job_id == self.job_id, StageCheckpoint.stage == stage,
+                ).update(values)
+                db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Job %s: could not checkpoint stage %s", self.job_id, stage)
+        finally:
+            db.close()
+
+    def clear(self):
+        """Drop the job's checkpoints once its report is stored. Never raises."""
+        db = SessionLocal()
+        try:
+            db.query(StageCheckpoint).filter(StageCheckpoint.job_id == self.job_id).delete()
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Job %s: could not clear stage checkpoints", self.job_id)
+        finally:
+            db.close()
@@ -1,18 +1,88 @@
 import os
 from datetime import datetime
 
-from sqlalchemy import create_engine, Column, String, Text, DateTime
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import create_engine, event, inspect, text, Column, String, Text, DateTime, Index, Integer, Float, LargeBinary, UniqueConstraint
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base, deferred, sessionmaker
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./analysis_results.db")
 
-# SQLite needs check_same_thread=False; other DBs don't need it
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+# Connection pool for server databases (per process; SQLite pools are sized by the driver)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Async drivers used by the API for each sync URL scheme
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+}
+
+
+def async_database_url(url: str) -> str:
+    """Map a sync DATABASE_URL to its async-driver equivalent (sqlite -> sqlite+aiosqlite, ...)."""
+    scheme, sep, rest = url.partition("://")
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+
+def _engine_options() -> dict:
+    if IS_SQLITE:
+        # SQLite needs check_same_thread=False; writers wait on the lock instead of failing at once
+        return {"connect_args": {"check_same_thread": False, "timeout": 30}}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def _tune_sqlite(dbapi_connection, connection_record):
+    """WAL lets the API read while a worker writes; the rest trades durability-on-power-loss for speed."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.execute("PRAGMA cache_size=-16000")      # 16 MB page cache per connection
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+# Sync engine: Celery worker, migrations and scripts
+engine = create_engine(DATABASE_URL, **_engine_options())
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _tune_sqlite)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Async engine: FastAPI endpoints, so queries don't block the event loop. Built on first use,
+# so the worker (which never uses it) does not need the async driver installed.
+_async_sessionmaker = None
+
+
+def get_async_sessionmaker() -> async_sessionmaker:
+    """Create the API's async engine and session factory on first call."""
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options())
+        if IS_SQLITE:
+            event.listen(async_engine.sync_engine, "connect", _tune_sqlite)
+        _async_sessionmaker = async_sessionmaker(
+            async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False,
+        )
+    return _async_sessionmaker
+
 
 class AnalysisJob(Base):
     __tablename__ = "analysis_jobs"
@@ -21,21 +91,131 @@ class AnalysisJob(Base):
     filename = Column(String, nullable=True)                    # Original uploaded filename
     query = Column(String)                                      # User query
     status = Column(String, default="pending")                  # pending | processing | completed | failed
-    result = Column(Text, nullable=True)                        # Full analysis output
+    result = deferred(Column(Text, nullable=True))              # Uncompressed report (rows from older versions)
     error = Column(Text, nullable=True)                         # Error message if failed
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
+    document_hash = Column(String(64), nullable=True)           # SHA-256 of the uploaded PDF
+    query_hash = Column(String(64), nullable=True)              # SHA-256 of the normalised query
+    source_job_id = Column(String, nullable=True, index=True)   # Job whose result this one reuses
+    stage_timings = Column(Text, nullable=True)                 # JSON per-stage timings of the crew run
+    token_usage = Column(Text, nullable=True)                   # JSON document tokens sent, per stage/tool
+    document_stats = Column(Text, nullable=True)                # JSON text normalisation savings
+    financial_metrics = Column(Text, nullable=True)             # JSON figures parsed without the LLM
+    batch_id = Column(String, nullable=True, index=True)        # Set for jobs submitted via /analyze/batch
+    priority = Column(Integer, nullable=True, default=0)        # LLM scheduling priority (higher first)
+    triage_decision = Column(String(16), nullable=True)         # reject | pass | uncertain (local pre-LLM check)
+    triage_score = Column(Float, nullable=True)                 # 0..1 financial-statement signal score
+    triage_ms = Column(Float, nullable=True)                    # Time spent triaging the upload
+    # Compressed report (see result_store.py): inline blob, or a path under RESULT_STORE_DIR
+    result_blob = deferred(Column(LargeBinary, nullable=True))
+    result_path = Column(String, nullable=True)
+    result_codec = Column(String(8), nullable=True)             # gzip | zstd
+    result_sha256 = Column(String(64), nullable=True)           # Digest of the uncompressed report
+    result_size = Column(Integer, nullable=True)                # Uncompressed size in bytes
+
+    __table_args__ = (
+        Index("ix_analysis_jobs_dedup", "document_hash", "query_hash"),
+        # Keyset pagination for /history; `id` breaks ties between equal timestamps
+        Index("ix_analysis_jobs_created_at", "created_at", "id"),
+        Index("ix_analysis_jobs_status_created_at", "status", "created_at", "id"),
+    )
+
+
+class JobMetric(Base):
+    """One timed span of a job: the whole job, its queue wait, a pipeline step, task, tool or LLM call."""
+    __tablename__ = "job_metrics"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String, index=True)                          # AnalysisJob.id
+    kind = Column(String(16))                                   # job | queue | step | task | tool | llm | throttle | search
+    name = Column(String)                                       # e.g. stage, tool or model name
+    stage = Column(String, nullable=True)                       # Pipeline stage the span ran in
+    duration_ms = Column(Float)
+    tokens_in = Column(Integer, nullable=True)                  # LLM spans only
+    tokens_out = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)  # Pruned after JOB_METRICS_RETENTION_DAYS
+
+    __table_args__ = (
+        Index("ix_job_metrics_kind_name", "kind", "name"),
+    )
+
+
+class SpanTotal(Base):
+    """Running totals of all spans per (kind, name, histogram bucket), read by /metrics."""
+    __tablename__ = "span_totals"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(16))
+    name = Column(String)
+    bucket = Column(Integer)                                    # Index into DURATION_BUCKETS; len() = above the last
+    count = Column(Integer, default=0)
+    duration_ms = Column(Float, default=0.0)
+    tokens_in = Column(Integer, default=0)
+    tokens_out = Column(Integer, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("kind", "name", "bucket", name="uq_span_totals_series"),
+    )
+
+
+class StageCheckpoint(Base):
+    """Output of one completed pipeline stage, kept so a retried job resumes after it."""
+    __tablename__ = "stage_checkpoints"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String, index=True)                          # AnalysisJob.id
+    stage = Column(String)                                      # Pipeline stage name
+    document_hash = Column(String(64))                          # Input the output was produced from
+    query_hash = Column(String(64))
+    output = Column(Text)
+    duration_ms = Column(Float)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("job_id", "stage", name="uq_stage_checkpoints_job_stage"),
+    )
+
+
+def _add_missing_columns():
+    """
+    Bring tables created by an older version up to date.
+
+    `create_all` never alters existing tables, so nullable columns added to a
+    model since the table was created are added here, along with any indexes
+    the table is missing.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        with engine.begin() as conn:
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 
 def create_tables():
-    """Create all tables if they don't exist."""
+    """Create all tables if they don't exist, adding any newer columns to old ones."""
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
 
 
 def get_db():
-    """FastAPI dependency: yields a DB session and closes it after use."""
+    """Yields a sync DB session and closes it after use (worker and scripts)."""
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """FastAPI dependency: yields an async DB session and closes it after use."""
+    async with get_async_sessionmaker()() as db:
+        yield db
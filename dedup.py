@@ -0,0 +1,67 @@
+## Reuse of completed or in-flight analyses for identical (document, query) pairs
+import os
+import hashlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AnalysisJob
+
+# Completed results older than this are not reused (0 disables reuse of completed jobs)
+DEDUP_TTL_SECONDS = int(os.getenv("DEDUP_TTL_SECONDS", str(7 * 24 * 3600)))
+
+IN_FLIGHT_STATUSES = ("pending", "processing")
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold and collapse whitespace so trivially different queries compare equal."""
+    return " ".join((query or "").lower().split())
+
+
+def query_sha256(query: str) -> str:
+    return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+async def find_reusable_job(
+    db: AsyncSession,
+    document_hash: str,
+    query_hash: str,
+    ttl_seconds: int = DEDUP_TTL_SECONDS,
+):
+    """
+    Find a job that already answers this (document, query) pair.
+
+    Returns the most recent completed job within `ttl_seconds`, or failing that
+    the oldest job still pending/processing so the new submission can join it.
+    Only original jobs are returned (never ones that themselves reuse a result).
+    """
+    base = select(AnalysisJob).where(
+        AnalysisJob.document_hash == document_hash,
+        AnalysisJob.query_hash == query_hash,
+        AnalysisJob.source_job_id.is_(None),
+    )
+
+    if ttl_seconds > 0:
+        cutoff = datetime.utcnow() - timedelta(seconds=ttl_seconds)
+        completed = await db.scalar(
+            base.where(AnalysisJob.status == "completed", AnalysisJob.completed_at >= cutoff)
+            .order_by(AnalysisJob.completed_at.desc())
+            .limit(1)
+        )
+        if completed:
+            return completed
+
+    return await db.scalar(
+        base.where(AnalysisJob.status.in_(IN_FLIGHT_STATUSES))
+        .order_by(AnalysisJob.created_at.asc())
+        .limit(1)
+    )
+
+
+async def resolve_source_job(db: AsyncSession, job: AnalysisJob) -> AnalysisJob:
+    """Return the job holding the actual result for `job` (itself if it is an original)."""
+    if not job.source_job_id:
+        return job
+    source = await db.get(AnalysisJob, job.source_job_id)
+    return source or job
@@ -0,0 +1,230 @@
+## Content-addressed cache for extracted PDF documents
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+load_dotenv()
+
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", "cache/extracted")
+EXTRACTION_CACHE_MAX_ITEMS = int(os.getenv("EXTRACTION_CACHE_MAX_ITEMS", "32"))
+# Disk tier budget; entries not read for EXTRACTION_CACHE_TTL_HOURS are dropped (0 = never expire)
+EXTRACTION_CACHE_MAX_MB = float(os.getenv("EXTRACTION_CACHE_MAX_MB", "512"))
+EXTRACTION_CACHE_TTL_HOURS = float(os.getenv("EXTRACTION_CACHE_TTL_HOURS", "720"))
+
+# Bump whenever the extraction output format changes so stale entries are discarded
+CACHE_FORMAT_VERSION = 3
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path: str) -> str:
+    """Return the hex SHA-256 digest of a file, read in 1 MiB chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Two-tier cache of extracted documents, keyed on the SHA-256 of the PDF bytes.
+
+    The memory tier is a bounded LRU local to the process. The disk tier is a
+    directory of JSON files shared by every Celery worker on the host; entries
+    are written atomically (temp file + rename) so concurrent workers never
+    observe a partial file. A disk hit refreshes the file's mtime; entries
+    older than `ttl` seconds are dropped, and after each write the oldest
+    files are removed until the tier is under `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = EXTRACTION_CACHE_DIR,
+        max_items: int = EXTRACTION_CACHE_MAX_ITEMS,
+        max_bytes: int = int(EXTRACTION_CACHE_MAX_MB * 1024 * 1024),
+        ttl: float = EXTRACTION_CACHE_TTL_HOURS * 3600,
+    ):
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def get_or_extract(self, file_path: str, extract, content_hash: str = None) -> dict:
+        """
+        Return the cached document for `file_path`, calling `extract(file_path)` on a miss.
+
+        Args:
+            file_path:    Path to the PDF on disk.
+            extract:      Callable returning a JSON-serialisable document dict.
+            content_hash: Precomputed SHA-256 of the file, if already known.
+        """
+        key = content_hash or self.content_hash(file_path)
+
+        document = self._get_memory(key)
+        if document is not None:
+            return document
+
+        document = self._get_disk(key)
+        if document is not None:
+            self._put_memory(key, document)
+            return document
+
+        with self._lock:
+            self.misses += 1
+        document = extract(file_path)
+        self._put_disk(key, document)
+        self._put_memory(key, document)
+        return document
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process, plus the current memory-tier size."""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+                "memory_items": len(self._memory),
+            }
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def content_hash(self, file_path: str) -> str:
+        """SHA-256 of the file, memoised on (path, size, mtime)."""
+        # Agents call the reader several times per job; avoid re-hashing an unchanged file
+        st = os.stat(file_path)
+        stat_key = (os.path.abspath(file_path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._hashes.get(stat_key)
+        if digest is None:
+            digest = file_sha256(file_path)
+            with self._lock:
+                if len(self._hashes) >= 4 * max(self.max_items, 1):
+                    self._hashes.clear()
+                self._hashes[stat_key] = digest
+        return digest
+
+    # ------------------------------------------------------------------
+    # Memory tier
+    # ------------------------------------------------------------------
+    def _get_memory(self, key: str):
+        with self._lock:
+            document = self._memory.get(key)
+            if document is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            return document
+
+    def _put_memory(self, key: str, document: dict):
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._memory[key] = document
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # Disk tier
+    # ------------------------------------------------------------------
+    def _disk_path(self, key: str) -> str:
+        # Two-level fan-out keeps directory listings small
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _get_disk(self, key: str):
+        path = self._disk_path(key)
+        try:
+            if self.ttl > 0 and os.path.getmtime(path) < time.time() - self.ttl:
+                self._remove_quietly(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if payload.get("version") != CACHE_FORMAT_VERSION:
+            self._remove_quietly(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.disk_hits += 1
+        return payload["document"]
+
+    def _put_disk(self, key: str, document: dict):
+        path = self._disk_path(key)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": CACHE_FORMAT_VERSION, "document": document}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            # The disk tier is best-effort; the memory tier still holds the result
+            if tmp_path and os.path.exists(tmp_path):
+                self._remove_quietly(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """Drop expired entries, then the oldest ones (by mtime) until the disk tier is under 90% of its budget."""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+
+        if self.ttl > 0:
+            cutoff = time.time() - self.ttl
+            for mtime, _, path in entries:
+                if mtime < cutoff:
+                    self._remove_quietly(path)
+            entries = [entry for entry in entries if entry[0] >= cutoff]
+
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        for _, size, path in sorted(entries):
+            self._remove_quietly(path)
+            freed += size
+            if freed >= target:
+                break
+
+    @staticmethod
+    def _remove_quietly(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Process-wide instance used by the document tools
+extraction_cache = ExtractionCache()
@@ -0,0 +1,180 @@
+## Job progress events: published by the worker, streamed to clients over SSE
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# auto -> Redis pub/sub when REDIS_URL is a redis:// URL, else in-process
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "auto").lower()
+# Events kept per job so late subscribers can catch up
+EVENTS_HISTORY = int(os.getenv("EVENTS_HISTORY", "100"))
+EVENTS_TTL_SECONDS = int(os.getenv("EVENTS_TTL_SECONDS", "86400"))
+# Stage outputs longer than this are truncated in events (the full report is in /results)
+EVENTS_MAX_OUTPUT_CHARS = int(os.getenv("EVENTS_MAX_OUTPUT_CHARS", "20000"))
+_LOCAL_MAX_JOBS = 1000
+
+
+def is_terminal(event: dict) -> bool:
+    """Whether no further events will follow for the job."""
+    return event["type"] == "completed" or (event["type"] == "failed" and not event.get("retrying"))
+
+
+class LocalEventBus:
+    """
+    In-process pub/sub, for running without Redis (API and worker in one process,
+    e.g. Celery eager mode or the benchmark harness).
+
+    Publishing is thread-safe; subscribers are asyncio consumers fed through
+    their own event loop.
+    """
+
+    def __init__(self, history: int = EVENTS_HISTORY):
+        self._history_size = history
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()          # job_id -> {"seq", "history", "subscribers"}
+
+    def _job(self, job_id: str) -> dict:
+        state = self._jobs.get(job_id)
+        if state is None:
+            state = self._jobs[job_id] = {"seq": 0, "history": deque(maxlen=self._history_size), "subscribers": set()}
+            # Forget the oldest jobs nobody is listening to
+            while len(self._jobs) > _LOCAL_MAX_JOBS:
+                oldest = next(iter(self._jobs))
+                if self._jobs[oldest]["subscribers"]:
+                    break
+                del self._jobs[oldest]
+        self._jobs.move_to_end(job_id)
+        return state
+
+    def publish(self, job_id: str, event: dict):
+        with self._lock:
+            state = self._job(job_id)
+            state["seq"] += 1
+            event = {**event, "seq": state["seq"]}
+            state["history"].append(event)
+            subscribers = list(state["subscribers"])
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    async def subscribe(self, job_id: str):
+        """Yield the job's recorded events, then live ones as they are published."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        subscriber = (loop, queue)
+        with self._lock:
+            state = self._job(job_id)
+            backlog = list(state["history"])
+            state["subscribers"].add(subscriber)
+        try:
+            for event in backlog:
+                yield event
+            while True:
+                yield await queue.get()
+        finally:
+            with self._lock:
+                state["subscribers"].discard(subscriber)
+
+
+class RedisEventBus:
+    """
+    Redis pub/sub shared by the API and every worker.
+
+    Each event gets a per-job sequence number and is appended to a capped list
+    as well as published, so a subscriber that connects mid-job replays what it
+    missed and then de-duplicates against the live channel. Raises on
+    construction if Redis is unreachable.
+    """
+
+    def __init__(self, url: str = REDIS_URL, history: int = EVENTS_HISTORY, ttl: int = EVENTS_TTL_SECONDS):
+        import redis
+
+        self.url = url
+        self.history = history
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url, socket_connect_timeout=2)
+        # from_url() does not connect; fail here rather than on every publish/subscribe
+        self._client.ping()
+
+    @staticmethod
+    def _keys(job_id: str):
+        base = f"fda:events:{job_id}"
+        return base, f"{base}:history", f"{base}:seq"
+
+    def publish(self, job_id: str, event: dict):
+        channel, history_key, seq_key = self._keys(job_id)
+        seq = self._client.incr(seq_key)
+        payload = json.dumps({**event, "seq": seq})
+        pipe = self._client.pipeline()
+        pipe.rpush(history_key, payload)
+        pipe.ltrim(history_key, -self.history, -1)
+        pipe.expire(history_key, self.ttl)
+        pipe.expire(seq_key, self.ttl)
+        pipe.publish(channel, payload)
+        pipe.execute()
+
+    async def subscribe(self, job_id: str):
+        import redis.asyncio as aioredis
+
+        channel, history_key, _ = self._keys(job_id)
+        client = aioredis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        try:
+            # Subscribe before reading the history so nothing falls in between
+            await pubsub.subscribe(channel)
+            last_seq = 0
+            for raw in await client.lrange(history_key, 0, -1):
+                event = json.loads(raw)
+                last_seq = event["seq"]
+                yield event
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                event = json.loads(message["data"])
+                if event["seq"] <= last_seq:
+                    continue
+                last_seq = event["seq"]
+                yield event
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+def _make_bus():
+    if EVENTS_BACKEND == "redis" or (EVENTS_BACKEND == "auto" and REDIS_URL.startswith(("redis://", "rediss://"))):
+        try:
+            return RedisEventBus()
+        except ImportError:
+            logger.warning("redis is not installed; job events fall back to in-process delivery")
+        except Exception as exc:
+            logger.warning("Redis is unreachable (%s); job events fall back to in-process delivery", exc)
+    return LocalEventBus()
+
+
+event_bus = _make_bus()
+
+
+def publish_event(job_id: str, event_type: str, **data):
+    """
+    Publish a progress event for `job_id`. Never raises: progress reporting
+    must not fail the job it reports on.
+    """
+    if not job_id:
+        return
+    try:
+        event_bus.publish(job_id, {"type": event_type, "job_id": job_id, "time": time.time(), **data})
+    except Exception:
+        logger.warning("Could not publish %s event for job %s", event_type, job_id, exc_info=True)
+
+
+def truncate_output(text: str) -> dict:
+    """Stage output payload for an event, cut to EVENTS_MAX_OUTPUT_CHARS."""
+    return {
+        "output": text[:EVENTS_MAX_OUTPUT_CHARS],
+        "truncated": len(text) > EVENTS_MAX_OUTPUT_CHARS,
+    }
@@ -0,0 +1,250 @@
+## Deterministic extraction of headline financial metrics from document text
+import re
+import json
+
+import numpy as np
+
+# Canonical metric -> label patterns, most specific first. Labels are matched lower-cased.
+METRIC_PATTERNS = {
+    "revenue": [r"^total revenues?$", r"^total net (sales|revenues?)$", r"^(net )?revenues?$", r"^net sales$"],
+    "gross_profit": [r"^total gross profit$", r"^gross profit$"],
+    "operating_income": [r"^(income|\(loss\) income|income \(loss\)) from operations$", r"^operating (income|profit)( \(loss\))?$"],
+    "net_income": [
+        r"^net income( \(loss\))? attributable to common (stockholders|shareholders)$",
+        r"^net (income|\(loss\) income|income \(loss\)|earnings)$",
+    ],
+    # Per-share labels only: share-count rows ("weighted-average shares ... diluted") say "shares"
+    "eps_diluted": [
+        r"^(?!.*\bshares\b)(eps\b|.*\bper (common )?share\b).*\bdiluted\b",
+        r"^diluted (eps|earnings per share|(net )?(income|loss|earnings) per (common )?share)\b",
+    ],
+    "eps_basic": [
+        r"^(?!.*\bshares\b)(eps\b|.*\bper (common )?share\b).*\bbasic\b",
+        r"^basic (eps|earnings per share|(net )?(income|loss|earnings) per (common )?share)\b",
+    ],
+    "operating_cash_flow": [
+        r"^net cash provided by( \(used in\))? operating activities$",
+        r"^(net )?cash flows? from operating activities$",
+        r"^operating cash flows?$",
+    ],
+    "capital_expenditures": [r"^capital expenditures$", r"^purchases of property and equipment.*$"],
+    "free_cash_flow": [r"^free cash flows?$"],
+    "cash": [r"^(total )?cash(,)? cash equivalents( and (short-term )?investments)?$", r"^cash and cash equivalents$"],
+    "total_debt": [r"^total debt( and finance leases)?$", r"^long-term debt( and finance leases)?(, net of current portion)?$"],
+    "total_assets": [r"^total assets$"],
+    "total_liabilities": [r"^total liabilities$"],
+    "total_equity": [r"^total (stockholders'?|shareholders'?) equity$", r"^total equity$"],
+}
+_COMPILED = {
+    metric: [re.compile(pattern) for pattern in patterns]
+    for metric, patterns in METRIC_PATTERNS.items()
+}
+# Per-share and ratio metrics are never scaled by the table unit
+_UNSCALED = {"eps_diluted", "eps_basic"}
+
+_UNIT_RE = re.compile(r"\(?\s*in\s+(thousands|millions|billions)\b", re.IGNORECASE)
+_UNIT_SCALE = {"thousands": 1e3, "millions": 1e6, "billions": 1e9}
+
+_NUMBER = r"\(?-?\$?\s?\d[\d,]*(?:\.\d+)?\)?%?"
+_ROW_RE = re.compile(rf"^(?P<label>[A-Za-z][^\d$()]*?(?:\([A-Za-z -]+\)[^\d$()]*?)*)\s*(?P<values>(?:{_NUMBER}\s*)+)$")
+_GAAP_RE = re.compile(r"\s*\(gaap\)")
+_NUMBER_RE = re.compile(_NUMBER)
+_PERIOD_RE = re.compile(
+    r"\b(?:(Q[1-4])[\s\-']*((?:19|20)\d{2})|(?:FY\s?)?((?:19|20)\d{2}))\b",
+    re.IGNORECASE,
+)
+
+
+def parse_number(token: str):
+    """
+    Parse a table figure: "1,234.5" -> 1234.5, "(1,234)" -> -1234.0, "$12" -> 12.0.
+
+    Returns None for percentages and anything unparseable.
+    """
+    token = token.strip()
+    if not token or token.endswith("%"):
+        return None
+    negative = token.startswith("(") and token.endswith(")")
+    cleaned = token.strip("()").replace("$", "").replace(",", "").replace(" ", "")
+    try:
+        value = float(cleaned)
+    except ValueError:
+        return None
+    return -abs(value) if negative else value
+
+
+def detect_unit(text: str):
+    """Return ("millions", 1e6)-style unit info from "(in millions)" captions, or (None, 1.0)."""
+    match = _UNIT_RE.search(text)
+    if not match:
+        return None, 1.0
+    unit = match.group(1).lower()
+    return unit, _UNIT_SCALE[unit]
+
+
+def _match_metric(label: str):
+    label = " ".join(label.lower().replace("’", "'").split()).rstrip(":")
+    # "(GAAP)" qualifies the reported figure; non-GAAP rows keep their qualifier and don't match
+    label = _GAAP_RE.sub("", label)
+    for metric, patterns in _COMPILED.items():
+        if any(p.search(label) for p in patterns):
+            return metric
+    return None
+
+
+def _qualified_label(label: str, lines: list, pos: int) -> str:
+    """
+    Prefix a bare "Basic"/"Diluted" row label with the heading it sits under
+    ("Net income per share:" or "Weighted average shares used ..."), found by
+    skipping sibling rows upwards.
+    """
+    if label.strip().rstrip(":").lower() not in ("basic", "diluted"):
+        return label
+    for line in reversed(lines[:pos]):
+        line = line.strip()
+        if line and not _ROW_RE.match(line):
+            return f"{line} {label}"
+    return label
+
+
+def _periods(lines: list, count: int) -> list:
+    """Find the nearest header line above the table with `count` period labels."""
+    for line in lines:
+        found = []
+        for quarter, q_year, year in _PERIOD_RE.findall(line):
+            found.append(f"{quarter.upper()}-{q_year}" if quarter else year)
+        if len(found) == count:
+            return found
+    return []
+
+
+def _period_sort_key(label: str):
+    if label.startswith("Q"):
+        return int(label[3:]), int(label[1])
+    return int(label), 5
+
+
+def extract_financial_metrics(pages: list) -> dict:
+    """
+    Parse headline metrics from the statement tables in `pages`.
+
+    Values are normalised to absolute currency units using the table's
+    "(in thousands/millions/billions)" caption, parentheses become negatives,
+    and percentage columns are dropped. Rows are grouped into tables by column
+    layout and ordered oldest -> newest; margins, leverage, free cash flow and
+    period-over-period changes are computed on each table's metric matrix.
+
+    Returns:
+        A compact JSON-serialisable payload (see `format_for_prompt`).
+    """
+    doc_unit, doc_scale = detect_unit("\n".join(pages))
+    rows = {}
+    for page_no, page in enumerate(pages, start=1):
+        page_unit, page_scale = detect_unit(page)
+        scale = page_scale if page_unit else doc_scale
+        lines = page.splitlines()
+        for pos, line in enumerate(lines):
+            match = _ROW_RE.match(line.strip())
+            if not match:
+                continue
+            metric = _match_metric(_qualified_label(match.group("label"), lines, pos))
+            if metric is None or metric in rows:
+                continue
+            values = [parse_number(tok) for tok in _NUMBER_RE.findall(match.group("values"))]
+            values = [v for v in values if v is not None]
+            if not values:
+                continue
+            factor = 1.0 if metric in _UNSCALED else scale
+            rows[metric] = {
+                "values": [v * factor for v in values],
+                "page": page_no,
+                # Look upwards from the row for the column header
+                "periods": _periods(reversed(lines[:pos]), len(values)),
+            }
+
+    if not rows:
+        return {"unit": doc_unit, "tables": [], "ratios": {}, "source_pages": {}}
+
+    # Rows sharing a column count come from the same table layout; align each group separately
+    groups = {}
+    for metric, r in rows.items():
+        groups.setdefault(len(r["values"]), []).append(metric)
+
+    tables = []
+    aligned = {}            # metric -> (table position, row position)
+    for width, metrics in sorted(groups.items(), key=lambda item: -len(item[1])):
+        matrix = np.array([rows[m]["values"] for m in metrics], dtype=float)
+        periods = next((rows[m]["periods"] for m in metrics if rows[m]["periods"]), [])
+        if periods:
+            order = sorted(range(width), key=lambda i: _period_sort_key(periods[i]))
+            matrix = matrix[:, order]
+            periods = [periods[i] for i in order]
+        else:
+            # Filings usually list the current period first; present oldest -> newest
+            matrix = matrix[:, ::-1]
+            periods = [f"P{i + 1}" for i in range(width)]
+
+        # Period-over-period change for every metric in the table at once
+        changes = np.full_like(matrix, np.nan)
+        if width > 1:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                changes[:, 1:] = (matrix[:, 1:] - matrix[:, :-1]) / np.abs(matrix[:, :-1])
+
+        for pos, metric in enumerate(metrics):
+            aligned[metric] = (len(tables), pos)
+        tables.append({"periods": periods, "matrix": matrix, "changes": changes, "metrics": metrics})
+
+    def ratio(numerator: str, denominator: str):
+        """Vectorised numerator/denominator when both come from the same table."""
+        if numerator not in aligned or denominator not in aligned:
+            return None
+        (t_num, r_num), (t_den, r_den) = aligned[numerator], aligned[denominator]
+        if t_num != t_den:
+            return None
+        matrix = tables[t_num]["matrix"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return tables[t_num]["periods"], matrix[r_num] / matrix[r_den]
+
+    ratios = {
+        "gross_margin": ratio("gross_profit", "revenue"),
+        "operating_margin": ratio("operating_income", "revenue"),
+        "net_margin": ratio("net_income", "revenue"),
+        "debt_to_equity": ratio("total_debt", "total_equity"),
+        "liabilities_to_assets": ratio("total_liabilities", "total_assets"),
+        "cash_conversion": ratio("operating_cash_flow", "net_income"),
+    }
+    if "free_cash_flow" not in aligned and ratio("operating_cash_flow", "capital_expenditures"):
+        t, r_ocf = aligned["operating_cash_flow"]
+        _, r_capex = aligned["capital_expenditures"]
+        matrix = tables[t]["matrix"]
+        # Capex is usually reported as a negative outflow
+        ratios["free_cash_flow"] = (tables[t]["periods"], matrix[r_ocf] - np.abs(matrix[r_capex]))
+
+    def clean(values):
+        return [None if not np.isfinite(v) else round(float(v), 4) for v in values]
+
+    return {
+        "unit": doc_unit,
+        "tables": [
+            {
+                "periods": table["periods"],
+                "metrics": {m: clean(table["matrix"][i]) for i, m in enumerate(table["metrics"])},
+                "changes": {m: clean(table["changes"][i]) for i, m in enumerate(table["metrics"])}
+                if len(table["periods"]) > 1 else {},
+            }
+            for table in tables
+        ],
+        "ratios": {
+            name: {"periods": value[0], "values": clean(value[1])}
+            for name, value in ratios.items()
+            if value is not None and np.isfinite(value[1]).any()
+        },
+        "source_pages": {m: r["page"] for m, r in rows.items()},
+    }
+
+
+def format_for_prompt(payload: dict) -> str:
+    """Render the payload compactly for an agent prompt."""
+    if not payload.get("tables"):
+        return "No statement figures could be extracted automatically; use the document search tool."
+    return json.dumps(payload, separators=(",", ":"))
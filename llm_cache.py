@@ -0,0 +1,264 @@
+## Prompt-level LLM response cache with an offline replay mode
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from dotenv import load_dotenv
+load_dotenv()
+
+from crewai import LLM
+
+from metrics import current_job, current_force_refresh, current_priority, estimate_tokens, job_metrics
+from rate_limiter import llm_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# off       -> always call the provider
+# readwrite -> serve cached responses, record new ones (default)
+# replay    -> serve cached responses only; a miss raises LLMReplayMiss (no network)
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "readwrite").lower()
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "cache/llm_cache.db")
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "256"))
+# Responses older than this are not served in readwrite mode (0 = never expire; replay ignores it)
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+# Provider 429s: retry the call (not the whole crew task) after pausing every process's quota
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3"))
+LLM_RATE_LIMIT_BACKOFF = float(os.getenv("LLM_RATE_LIMIT_BACKOFF", "10"))
+
+# Uploaded files get a fresh UUID name per submission; key prompts on the content instead
+_UPLOAD_PATH_RE = re.compile(r"data/financial_document_[0-9a-fA-F-]{36}\.pdf")
+
+
+class LLMReplayMiss(RuntimeError):
+    """Raised in replay mode when a prompt has no recorded response."""
+
+
+class LLMResponseCache:
+    """
+    SQLite store of LLM responses keyed on (model, prompt, parameters).
+
+    Safe to share between threads and processes (WAL journal). Responses older
+    than `ttl` seconds are treated as misses and dropped; when the stored
+    responses exceed `max_bytes`, the least recently used ones are evicted.
+    """
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        max_bytes: int = int(LLM_CACHE_MAX_MB * 1024 * 1024),
+        ttl: float = LLM_CACHE_TTL_HOURS * 3600,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_responses ("
+                " key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER,"
+                " created_at REAL, last_access REAL, hits INTEGER DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_responses_last_access ON llm_responses (last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_responses_created_at ON llm_responses (created_at)")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(model: str, messages, params: dict) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": messages, "params": params},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, expire: bool = True):
+        """Return the stored response, or None. With `expire`, responses older than the TTL are misses."""
+        conn = self._conn()
+        row = conn.execute("SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)).fetchone()
+        stale = row is not None and expire and self.ttl > 0 and row[1] < time.time() - self.ttl
+        if stale:
+            conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+        with self._lock:
+            if row is None or stale:
+                self.misses += 1
+                return None
+            self.hits += 1
+        conn.execute(
+            "UPDATE llm_responses SET last_access = ?, hits = hits + 1 WHERE key = ?",
+            (time.time(), key),
+        )
+        return row[0]
+
+    def put(self, key: str, model: str, response: str):
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO llm_responses (key, model, response, size, created_at, last_access, hits)"
+            " VALUES (?, ?, ?, ?, ?, ?, 0)",
+            (key, model, response, len(response.encode("utf-8")), now, now),
+        )
+        with self._lock:
+            self._puts_since_evict += 1
+            due = self._puts_since_evict >= 20
+            if due:
+                self._puts_since_evict = 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop expired responses, then least-recently-used ones until the store is under 90% of its budget."""
+        conn = self._conn()
+        if self.ttl > 0 and LLM_CACHE_MODE != "replay":
+            conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (time.time() - self.ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        doomed = []
+        rows = conn.execute("SELECT key, size FROM llm_responses ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            doomed.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        conn.executemany("DELETE FROM llm_responses WHERE key = ?", doomed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+llm_response_cache = LLMResponseCache()
+
+
+def _document_aliases(text: str) -> dict:
+    """Map each uploaded-file path in `text` to a stable content-based placeholder."""
+    from document_cache import extraction_cache
+
+    aliases = {}
+    for path in set(_UPLOAD_PATH_RE.findall(text)):
+        try:
+            aliases[path] = f"<document:{extraction_cache.content_hash(path)}>"
+        except OSError:
+            pass
+    return aliases
+
+
+def _substitute(value, mapping: dict):
+    if isinstance(value, str):
+        for old, new in mapping.items():
+            value = value.replace(old, new)
+        return value
+    if isinstance(value, list):
+        return [_substitute(v, mapping) for v in value]
+    if isinstance(value, dict):
+        return {k: _substitute(v, mapping) for k, v in value.items()}
+    return value
+
+
+class CachedLLM(LLM):
+    """
+    crewai LLM whose text completions go through `llm_response_cache`.
+
+    Calls with native tool/function definitions are not cached, since their
+    results depend on executing those functions; in replay mode they raise
+    LLMReplayMiss rather than reach the provider. Jobs submitted with
+    `force_refresh` skip cached responses and record fresh ones.
+    """
+
+    def _cache_params(self) -> dict:
+        return {
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "max_tokens": self.max_tokens,
+            "stop": self.stop,
+            "seed": self.seed,
+            "response_format": str(self.response_format) if self.response_format else None,
+        }
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        start = time.perf_counter()
+        response, served_by, waited = self._cached_call(messages, tools, callbacks, available_functions, **kwargs)
+        prompt = messages if isinstance(messages, str) else "".join(
+            str(m.get("content", "")) for m in messages
+        )
+        job_metrics.record(
+            "llm",
+            served_by,
+            # Rate-limiter waits are recorded separately as throttle spans
+            time.perf_counter() - start - waited,
+            tokens_in=estimate_tokens(prompt),
+            tokens_out=estimate_tokens(response) if isinstance(response, str) else None,
+        )
+        return response
+
+    def _cached_call(self, messages, tools, callbacks, available_functions, **kwargs):
+        """Return (response, "cache" or the model name that produced it, seconds throttled)."""
+        if LLM_CACHE_MODE == "replay" and (tools or available_functions):
+            raise LLMReplayMiss("Function-calling requests are never recorded (LLM_CACHE_MODE=replay)")
+        if LLM_CACHE_MODE == "off" or tools or available_functions:
+            response, waited = self._provider_call(messages, tools, callbacks, available_functions, **kwargs)
+            return response, self.model, waited
+
+        aliases = _document_aliases(json.dumps(messages, default=str))
+        key = llm_response_cache.make_key(self.model, _substitute(messages, aliases), self._cache_params())
+
+        replay = LLM_CACHE_MODE == "replay"
+        # A forced refresh still overwrites the entry below; replay has nothing else to serve
+        skip_read = current_force_refresh.get() and not replay
+        cached = None if skip_read else llm_response_cache.get(key, expire=not replay)
+        if cached is not None:
+            # Point any recorded file references back at this job's upload
+            return _substitute(cached, {alias: path for path, alias in aliases.items()}), "cache", 0.0
+
+        if replay:
+            raise LLMReplayMiss(f"No recorded response for prompt {key[:12]} (LLM_CACHE_MODE=replay)")
+
+        response, waited = self._provider_call(messages, tools, callbacks, available_functions, **kwargs)
+        if isinstance(response, str) and response:
+            llm_response_cache.put(key, self.model, _substitute(response, aliases))
+        return response, self.model, waited
+
+    def _provider_call(self, messages, tools, callbacks, available_functions, **kwargs):
+        """Call the provider through the shared rate limiter. Returns (response, seconds throttled)."""
+        waited = 0.0
+        for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+            wait = llm_rate_limiter.acquire(job_id=current_job.get(), priority=current_priority.get())
+            job_metrics.record("throttle", "llm_rate_limiter", wait)
+            waited += wait
+            try:
+                response = super().call(messages, tools=tools, callbacks=callbacks,
+                                        available_functions=available_functions, **kwargs)
+                return response, waited
+            except Exception as exc:
+                if not _is_rate_limit_error(exc) or attempt == LLM_RATE_LIMIT_RETRIES:
+                    raise
+                backoff = LLM_RATE_LIMIT_BACKOFF * 2 ** attempt
+                logger.warning("LLM provider rate limit hit; pausing requests for %.0fs", backoff)
+                llm_rate_limiter.penalize(backoff)
+
+
+def _is_rate_limit_error(exc: Exception) -> bool:
+    """litellm raises RateLimitError for HTTP 429; match on name/status to avoid importing it here."""
+    return type(exc).__name__ == "RateLimitError" or getattr(exc, "status_code", None) == 429
@@ -1,10 +1,108 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Request, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from celery import group
+from sqlalchemy import select, and_, or_, func
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
+import json
 import uuid
+import hashlib
+import asyncio
+import base64
+import binascii
+from datetime import datetime
+
+from database import create_tables, get_async_db, get_async_sessionmaker, AnalysisJob
+from events import event_bus, is_terminal
+from dedup import find_reusable_job, resolve_source_job, query_sha256
+from metrics import render_prometheus, summarize_job_metrics
+from result_store import iter_result
+from uploads import receive_pdf_upload, receive_pdf_uploads, UploadError, MAX_UPLOAD_BYTES
+from celery_app import analysis_signature, enqueue_analysis
+
+DEFAULT_QUERY = "Analyze this financial document for investment insights"
+
+HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", "100"))
+# Accepted range of the `priority` form field (higher is served first by the LLM rate limiter)
+PRIORITY_RANGE = (-10, 10)
+# Seconds between SSE keep-alive comments (keeps proxies from closing idle streams)
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+# A reused job reports its source's status: the worker's copy onto the linked row can be missed
+# when the source finishes before the link is committed. Queries using these outer-join SourceJob
+SourceJob = aliased(AnalysisJob)
+SOURCE_JOIN = AnalysisJob.source_job_id == SourceJob.id
+JOB_STATUS = func.coalesce(SourceJob.status, AnalysisJob.status)
+
+# Metadata shown by /history; `result` is never loaded for listings
+HISTORY_COLUMNS = (
+    AnalysisJob.id,
+    AnalysisJob.filename,
+    AnalysisJob.query,
+    JOB_STATUS.label("status"),
+    AnalysisJob.created_at,
+    func.coalesce(SourceJob.completed_at, AnalysisJob.completed_at).label("completed_at"),
+    AnalysisJob.source_job_id,
+)
+
+# OpenAPI schema for the streamed multipart body (the endpoint parses it itself)
+ANALYZE_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                        "query": {"type": "string", "default": DEFAULT_QUERY},
+                        "force_refresh": {"type": "boolean", "default": False},
+                        "priority": {"type": "integer", "default": 0, "minimum": PRIORITY_RANGE[0],
+                                     "maximum": PRIORITY_RANGE[1]},
+                    },
+                }
+            }
+        },
+    }
+}
+
+ANALYZE_BATCH_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["files"],
+                    "properties": {
+                        "files": {
+                            "type": "array",
+                            "items": {"type": "string", "format": "binary"},
+                            "description": "PDFs and/or zip archives of PDFs",
+                        },
+                        "query": {"type": "string", "default": DEFAULT_QUERY},
+                        "force_refresh": {"type": "boolean", "default": False},
+                        "priority": {"type": "integer", "default": 0, "minimum": PRIORITY_RANGE[0],
+                                     "maximum": PRIORITY_RANGE[1]},
+                    },
+                }
+            }
+        },
+    }
+}
+
+
+def _parse_priority(fields: dict) -> int:
+    raw = (fields.get("priority") or "0").strip()
+    try:
+        priority = int(raw)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="priority must be an integer")
+    return max(PRIORITY_RANGE[0], min(PRIORITY_RANGE[1], priority))
 
-from database import create_tables, get_db, AnalysisJob
-from worker import process_financial_document_task
 
 app = FastAPI(
     title="Financial Document Analyzer",
@@ -17,7 +115,9 @@ app = FastAPI(
 @app.on_event("startup")
 async def startup_event():
     """Create database tables on first run."""
-    create_tables()
+    await run_in_threadpool(create_tables)
+    # Build the async engine now, so a missing async driver fails at startup, not on the first request
+    get_async_sessionmaker()
 
 
 # ---------------------------------------------------------------------------
@@ -32,52 +132,97 @@ async def root():
 # ---------------------------------------------------------------------------
 # Submit analysis job (async)
 # ---------------------------------------------------------------------------
-@app.post("/analyze", summary="Submit a financial document for analysis")
+@app.post(
+    "/analyze",
+    summary="Submit a financial document for analysis",
+    openapi_extra=ANALYZE_REQUEST_BODY,
+)
 async def analyze_document_endpoint(
-    file: UploadFile = File(...),
-    query: str = Form(default="Analyze this financial document for investment insights"),
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Upload a financial PDF and submit it for async analysis.
 
-    Returns a **job_id** immediately. The actual analysis runs in the background
-    via a Celery worker. Poll `/status/{job_id}` to track progress, then fetch
-    the full report from `/results/{job_id}`.
+    The upload is streamed to disk in chunks and rejected early if it is not a
+    PDF or exceeds `MAX_UPLOAD_MB`. Returns a **job_id** immediately. The actual
+    analysis runs in the background via a Celery worker. Poll `/status/{job_id}`
+    to track progress, then fetch the full report from `/results/{job_id}`.
+
+    If the same document was already analysed with an equivalent query, the new
+    job is linked to that result (or joins the in-flight run) instead of being
+    queued again. Send `force_refresh=true` to always run a fresh analysis.
     """
     file_id = str(uuid.uuid4())
     file_path = f"data/financial_document_{file_id}.pdf"
 
     try:
-        os.makedirs("data", exist_ok=True)
-
-        # Save uploaded file to disk
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        upload, fields = await receive_pdf_upload(request, file_path, max_bytes=MAX_UPLOAD_BYTES)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
+    try:
         # Normalise empty query
-        if not query or query.strip() == "":
-            query = "Analyze this financial document for investment insights"
+        query = fields.get("query") or ""
+        if query.strip() == "":
+            query = DEFAULT_QUERY
+        query_hash = query_sha256(query)
+        force_refresh = fields.get("force_refresh", "").strip().lower() in ("1", "true", "yes")
+        priority = _parse_priority(fields)
+
+        # Reuse a completed or in-flight analysis of the same document and query
+        source = None if force_refresh else await find_reusable_job(db, upload.sha256, query_hash)
+        if source:
+            job = AnalysisJob(
+                id=file_id,
+                filename=upload.filename,
+                query=query.strip(),
+                status=source.status,
+                document_hash=upload.sha256,
+                query_hash=query_hash,
+                source_job_id=source.id,
+                completed_at=source.completed_at,
+            )
+            db.add(job)
+            await db.commit()
+            # No worker will read this copy of the file
+            os.remove(file_path)
+
+            return {
+                "status": "completed" if source.status == "completed" else "queued",
+                "job_id": file_id,
+                "message": "Identical analysis found; reusing its result."
+                           if source.status == "completed"
+                           else "Identical analysis already running; joined it.",
+                "file_processed": upload.filename,
+                "file_size": upload.size,
+                "sha256": upload.sha256,
+                "source_job_id": source.id,
+            }
 
         # Persist job record to DB
         job = AnalysisJob(
             id=file_id,
-            filename=file.filename,
+            filename=upload.filename,
             query=query.strip(),
             status="pending",
+            document_hash=upload.sha256,
+            query_hash=query_hash,
+            priority=priority,
         )
         db.add(job)
-        db.commit()
+        await db.commit()
 
-        # Push task onto Celery queue (non-blocking)
-        process_financial_document_task.delay(file_id, query.strip(), file_path)
+        # Push task onto Celery queue (the broker round-trip runs off the event loop)
+        await run_in_threadpool(enqueue_analysis, file_id, query.strip(), file_path, priority, force_refresh)
 
         return {
             "status": "queued",
             "job_id": file_id,
             "message": "Document submitted for analysis. Poll /status/{job_id} to track progress.",
-            "file_processed": file.filename,
+            "file_processed": upload.filename,
+            "file_size": upload.size,
+            "sha256": upload.sha256,
         }
 
     except Exception as e:
@@ -87,71 +232,423 @@ async def analyze_document_endpoint(
                 os.remove(file_path)
             except Exception:
                 pass
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(
             status_code=500,
             detail=f"Error queuing financial document: {str(e)}",
         )
 
 
+# ---------------------------------------------------------------------------
+# Submit a batch of documents
+# ---------------------------------------------------------------------------
+def _enqueue_jobs(jobs: list, force_refresh: bool = False):
+    """Publish one task per job in a single Celery group (one broker round-trip per batch)."""
+    group(
+        analysis_signature(
+            job.id, job.query, f"data/financial_document_{job.id}.pdf", job.priority or 0, force_refresh,
+        )
+        for job in jobs
+    ).apply_async()
+
+
+@app.post(
+    "/analyze/batch",
+    summary="Submit several financial documents for analysis",
+    openapi_extra=ANALYZE_BATCH_REQUEST_BODY,
+)
+async def analyze_batch_endpoint(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Upload several PDFs (repeated `files` parts and/or zip archives of PDFs)
+    with one shared `query`, and queue them as a single batch.
+
+    All job records are written in one transaction and the tasks are published
+    as one Celery group. Files that are too large or not PDFs are reported under
+    `rejected` without failing the batch. Identical documents (within the batch
+    or already analysed) are deduplicated per item unless `force_refresh=true`.
+    Track progress with `/batch/{batch_id}`.
+    """
+    batch_id = str(uuid.uuid4())
+    file_ids = {}
+
+    def new_upload_path():
+        file_id = str(uuid.uuid4())
+        path = f"data/financial_document_{file_id}.pdf"
+        file_ids[path] = file_id
+        return path
+
+    try:
+        uploads, rejected, fields = await receive_pdf_uploads(request, new_upload_path)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if not uploads:
+        for path in file_ids:
+            await run_in_threadpool(_remove_quietly, path)
+        raise HTTPException(
+            status_code=400,
+            detail={"message": "No acceptable PDFs in the batch", "rejected": [r.__dict__ for r in rejected]},
+        )
+
+    query = (fields.get("query") or "").strip() or DEFAULT_QUERY
+    query_hash = query_sha256(query)
+    force_refresh = fields.get("force_refresh", "").strip().lower() in ("1", "true", "yes")
+    try:
+        priority = _parse_priority(fields)
+    except HTTPException:
+        for upload in uploads:
+            await run_in_threadpool(_remove_quietly, upload.path)
+        raise
+
+    jobs, to_enqueue, unused_files = [], [], []
+    originals = {}                  # document hash -> job created earlier in this batch
+    try:
+        for upload in uploads:
+            source = originals.get(upload.sha256)
+            if source is None and not force_refresh:
+                source = await find_reusable_job(db, upload.sha256, query_hash)
+            job = AnalysisJob(
+                id=file_ids[upload.path],
+                filename=upload.filename,
+                query=query,
+                status=source.status if source else "pending",
+                document_hash=upload.sha256,
+                query_hash=query_hash,
+                source_job_id=source.id if source else None,
+                completed_at=source.completed_at if source else None,
+                batch_id=batch_id,
+                priority=priority,
+            )
+            db.add(job)
+            jobs.append(job)
+            if source:
+                unused_files.append(upload.path)
+            else:
+                originals[upload.sha256] = job
+                to_enqueue.append(job)
+        await db.commit()
+    except Exception as e:
+        for upload in uploads:
+            await run_in_threadpool(_remove_quietly, upload.path)
+        raise HTTPException(status_code=500, detail=f"Error queuing batch: {str(e)}")
+
+    for path in unused_files:
+        # No worker will read these copies
+        await run_in_threadpool(_remove_quietly, path)
+
+    if to_enqueue:
+        try:
+            await run_in_threadpool(_enqueue_jobs, to_enqueue, force_refresh)
+        except Exception as e:
+            for job in to_enqueue:
+                job.status = "failed"
+                job.error = f"Could not queue job: {e}"
+                job.completed_at = datetime.utcnow()
+                await run_in_threadpool(_remove_quietly, f"data/financial_document_{job.id}.pdf")
+            await db.commit()
+            raise HTTPException(status_code=503, detail=f"Error queuing batch: {str(e)}")
+
+    return {
+        "batch_id": batch_id,
+        "status": "queued",
+        "total": len(jobs),
+        "queued": len(to_enqueue),
+        "reused": len(jobs) - len(to_enqueue),
+        "rejected": [r.__dict__ for r in rejected],
+        "jobs": [
+            {
+                "job_id": job.id,
+                "filename": job.filename,
+                "status": job.status,
+                "source_job_id": job.source_job_id,
+            }
+            for job in jobs
+        ],
+    }
+
+
+def _remove_quietly(path: str):
+    if os.path.exists(path):
+        try:
+            os.remove(path)
+        except Exception:
+            pass
+
+
 # ---------------------------------------------------------------------------
 # Job status
 # ---------------------------------------------------------------------------
 @app.get("/status/{job_id}", summary="Check analysis job status")
-async def get_job_status(job_id: str, db: Session = Depends(get_db)):
+async def get_job_status(job_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     Returns the current status of an analysis job.
 
     **Statuses:** `pending` → `processing` → `completed` | `failed`
     """
-    job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+    job = await db.get(AnalysisJob, job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
+    source = await resolve_source_job(db, job)
 
     return {
         "job_id": job.id,
-        "status": job.status,
+        "status": source.status,
         "filename": job.filename,
         "query": job.query,
         "created_at": job.created_at.isoformat() if job.created_at else None,
-        "completed_at": job.completed_at.isoformat() if job.completed_at else None,
-        "error": job.error if job.status == "failed" else None,
+        "completed_at": source.completed_at.isoformat() if source.completed_at else None,
+        "error": source.error if source.status == "failed" else None,
+        "source_job_id": job.source_job_id,
+        "stage_timings": json.loads(source.stage_timings) if source.stage_timings else None,
+        "token_usage": json.loads(source.token_usage) if source.token_usage else None,
+        "document_stats": json.loads(source.document_stats) if source.document_stats else None,
+        "triage": {
+            "decision": source.triage_decision,
+            "score": source.triage_score,
+            "ms": round(source.triage_ms, 1) if source.triage_ms is not None else None,
+        } if source.triage_decision else None,
+        "metrics": await db.run_sync(summarize_job_metrics, source.id),
     }
 
 
+# ---------------------------------------------------------------------------
+# Live progress (Server-Sent Events)
+# ---------------------------------------------------------------------------
+def _sse(event: dict) -> str:
+    return f"id: {event.get('seq', 0)}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def _event_stream(job_id: str, source_id: str, last_event_id: int):
+    """Relay the source job's events until a terminal one, with periodic keep-alives."""
+    queue = asyncio.Queue()
+
+    async def pump():
+        async for event in event_bus.subscribe(source_id):
+            await queue.put(event)
+
+    pump_task = asyncio.create_task(pump())
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if pump_task.done():
+                    # Subscription ended (e.g. the broker went away); let the client reconnect
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            if event.get("seq", 0) <= last_event_id:
+                continue
+            yield _sse({**event, "job_id": job_id})
+            if is_terminal(event):
+                return
+    finally:
+        pump_task.cancel()
+
+
+@app.get("/events/{job_id}", summary="Stream live job progress (Server-Sent Events)")
+async def stream_job_events(job_id: str, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Streams the job's progress as `text/event-stream` until it completes or fails:
+    `status`, `triage`, `document_loaded`, `financials_extracted`, `stage_started`,
+    `stage_completed` (with the stage's output), `stage_skipped`, then `completed`
+    or `failed`. Events already published are replayed first, so connecting late
+    is fine; reconnecting clients resume after `Last-Event-ID`.
+
+    Use this instead of polling `/status/{job_id}`.
+    """
+    job = await db.get(AnalysisJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    source = await resolve_source_job(db, job)
+    source_id, status, error = source.id, source.status, source.error
+    # Don't hold a pooled connection for the lifetime of the stream
+    await db.close()
+
+    last_event_id = request.headers.get("last-event-id", "")
+    last_event_id = int(last_event_id) if last_event_id.isdigit() else 0
+
+    if status in ("completed", "failed"):
+        # Finished (possibly before events existed, or past the replay window): report and close
+        event = {"type": status, "job_id": job_id, "status": status}
+        if status == "failed":
+            event["error"] = error
+        stream = iter([_sse(event)])
+    else:
+        stream = _event_stream(job_id, source_id, last_event_id)
+
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # ---------------------------------------------------------------------------
 # Fetch results
 # ---------------------------------------------------------------------------
 @app.get("/results/{job_id}", summary="Fetch completed analysis results")
-async def get_job_results(job_id: str, db: Session = Depends(get_db)):
+async def get_job_results(job_id: str, request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Returns the full multi-agent analysis report once it is complete.
     Returns a 202-style response if the job is still running.
+
+    Completed reports are streamed from compressed storage with an ETag;
+    a request whose If-None-Match matches gets an empty 304 without the
+    report being read.
     """
-    job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+    job = await db.get(AnalysisJob, job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
+    source = await resolve_source_job(db, job)
 
-    if job.status in ("pending", "processing"):
+    if source.status in ("pending", "processing"):
         return {
             "job_id": job.id,
-            "status": job.status,
+            "status": source.status,
             "message": "Analysis is still in progress. Try again shortly.",
         }
 
-    if job.status == "failed":
+    if source.status == "failed":
         raise HTTPException(
             status_code=500,
-            detail=f"Analysis failed: {job.error}",
+            detail=f"Analysis failed: {source.error}",
         )
 
-    return {
+    head = {
         "job_id": job.id,
-        "status": job.status,
+        "status": source.status,
         "filename": job.filename,
         "query": job.query,
-        "analysis": job.result,
+    }
+    tail = {
         "created_at": job.created_at.isoformat() if job.created_at else None,
-        "completed_at": job.completed_at.isoformat() if job.completed_at else None,
+        "completed_at": source.completed_at.isoformat() if source.completed_at else None,
+        "source_job_id": job.source_job_id,
+    }
+    etag = _results_etag(head, tail, source.result_sha256)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    legacy_text, blob = (await db.execute(
+        select(AnalysisJob.result, AnalysisJob.result_blob).where(AnalysisJob.id == source.id)
+    )).one()
+    chunks = iter_result(source.result_codec, blob, source.result_path, legacy_text)
+    has_result = bool(source.result_codec) or legacy_text is not None
+    return StreamingResponse(
+        _stream_results_json(head, tail, chunks if has_result else None),
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+def _results_etag(head: dict, tail: dict, result_sha256: str) -> str:
+    """Strong ETag over everything /results returns; a finished job's response never changes."""
+    digest = hashlib.sha256(json.dumps([head, tail, result_sha256], sort_keys=True).encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _stream_results_json(head: dict, tail: dict, chunks):
+    """
+    Emit the /results JSON document with the report streamed into `analysis`
+    chunk by chunk. A sync generator, so Starlette iterates it (and the file or
+    blob decompression behind it) in the threadpool.
+    """
+    yield json.dumps(head)[:-1] + ', "analysis": '
+    if chunks is None:
+        yield "null"
+    else:
+        yield '"'
+        for chunk in chunks:
+            yield json.dumps(chunk)[1:-1]
+        yield '"'
+    yield ", " + json.dumps(tail)[1:]
+
+
+# ---------------------------------------------------------------------------
+# Extracted financial figures
+# ---------------------------------------------------------------------------
+@app.get("/financials/{job_id}", summary="Fetch figures parsed from the document")
+async def get_job_financials(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Returns the headline metrics, ratios and period-over-period changes parsed
+    deterministically from the document's statement tables. These are available
+    as soon as the worker has read the document, before the LLM analysis ends.
+    """
+    job = await db.get(AnalysisJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    source = await resolve_source_job(db, job)
+
+    if not source.financial_metrics:
+        return {
+            "job_id": job.id,
+            "status": source.status,
+            "message": "Figures have not been extracted yet. Try again shortly.",
+        }
+
+    return {
+        "job_id": job.id,
+        "status": source.status,
+        "financials": json.loads(source.financial_metrics),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Batch progress
+# ---------------------------------------------------------------------------
+@app.get("/batch/{batch_id}", summary="Check the progress of a batch")
+async def get_batch_status(batch_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Returns aggregate status and progress of a batch, plus the status of each job.
+
+    **Batch statuses:** `queued` → `processing` → `completed` | `partially_failed` | `failed`
+    """
+    rows = (await db.execute(
+        select(AnalysisJob.id, AnalysisJob.filename, JOB_STATUS.label("status"), AnalysisJob.source_job_id)
+        .outerjoin(SourceJob, SOURCE_JOIN)
+        .where(AnalysisJob.batch_id == batch_id)
+        .order_by(AnalysisJob.created_at, AnalysisJob.id)
+    )).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    counts = {"pending": 0, "processing": 0, "completed": 0, "failed": 0}
+    for row in rows:
+        counts[row.status] = counts.get(row.status, 0) + 1
+    total = len(rows)
+    done = counts["completed"] + counts["failed"]
+    if done == total:
+        status = "completed" if not counts["failed"] else "failed" if counts["failed"] == total else "partially_failed"
+    else:
+        status = "processing" if done or counts["processing"] else "queued"
+
+    return {
+        "batch_id": batch_id,
+        "status": status,
+        "total": total,
+        "counts": counts,
+        "progress": round(done / total, 4),
+        "jobs": [
+            {
+                "job_id": row.id,
+                "filename": row.filename,
+                "status": row.status,
+                "source_job_id": row.source_job_id,
+            }
+            for row in rows
+        ],
     }
 
 
@@ -161,34 +658,80 @@ async def get_job_results(job_id: str, db: Session = Depends(get_db)):
 @app.get("/history", summary="List past analysis jobs")
 async def get_analysis_history(
     limit: int = 10,
-    db: Session = Depends(get_db),
+    cursor: str = None,
+    status: str = None,
+    filename: str = None,
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
-    Returns the most recent `limit` analysis jobs (default 10), newest first.
-    Useful for reviewing past analyses without re-uploading documents.
+    Returns analysis jobs newest first, `limit` at a time (default 10, max `HISTORY_MAX_LIMIT`).
+
+    Pass the returned `next_cursor` as `cursor` to fetch the next page; it is
+    null on the last page. Filter with `status` (exact) and `filename`
+    (case-insensitive substring).
     """
-    jobs = (
-        db.query(AnalysisJob)
-        .order_by(AnalysisJob.created_at.desc())
-        .limit(limit)
-        .all()
-    )
+    limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+    stmt = select(*HISTORY_COLUMNS).outerjoin(SourceJob, SOURCE_JOIN)
+    if status:
+        stmt = stmt.where(JOB_STATUS == status)
+    if filename:
+        pattern = filename.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        stmt = stmt.where(AnalysisJob.filename.ilike(f"%{pattern}%", escape="\\"))
+    if cursor:
+        created_at, job_id = _decode_history_cursor(cursor)
+        # Rows strictly after the cursor in (created_at DESC, id DESC) order
+        stmt = stmt.where(or_(
+            AnalysisJob.created_at < created_at,
+            and_(AnalysisJob.created_at == created_at, AnalysisJob.id < job_id),
+        ))
+    stmt = stmt.order_by(AnalysisJob.created_at.desc(), AnalysisJob.id.desc()).limit(limit + 1)
+
+    rows = (await db.execute(stmt)).all()
+    page, more = rows[:limit], len(rows) > limit
     return {
-        "total": len(jobs),
+        "total": len(page),
+        "next_cursor": _encode_history_cursor(page[-1]) if more else None,
         "jobs": [
             {
-                "job_id": job.id,
-                "filename": job.filename,
-                "query": job.query,
-                "status": job.status,
-                "created_at": job.created_at.isoformat() if job.created_at else None,
-                "completed_at": job.completed_at.isoformat() if job.completed_at else None,
+                "job_id": row.id,
+                "filename": row.filename,
+                "query": row.query,
+                "status": row.status,
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+                "completed_at": row.completed_at.isoformat() if row.completed_at else None,
+                "source_job_id": row.source_job_id,
             }
-            for job in jobs
+            for row in page
         ],
     }
 
 
+def _encode_history_cursor(row) -> str:
+    raw = f"{row.created_at.isoformat()}|{row.id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_history_cursor(cursor: str):
+    try:
+        created_at, job_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at), job_id
+    except (ValueError, UnicodeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+@app.get("/metrics", summary="Prometheus metrics", response_class=PlainTextResponse)
+async def get_metrics(db: AsyncSession = Depends(get_async_db)):
+    """
+    Histograms of job, queue-wait, pipeline-step, task, tool and LLM-call
+    durations, estimated LLM token totals and job counts by status, in the
+    Prometheus text format.
+    """
+    return PlainTextResponse(await db.run_sync(render_prometheus), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,298 @@
+## Lightweight per-job usage accounting and timing instrumentation
+import os
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Set by the worker around each job / pipeline stage; read by the tools
+current_job = contextvars.ContextVar("current_job", default=None)
+current_stage = contextvars.ContextVar("current_stage", default=None)
+# Scheduling priority of the current job (higher is served first by the LLM rate limiter)
+current_priority = contextvars.ContextVar("current_priority", default=0)
+# Set for force_refresh submissions: the job records fresh LLM responses instead of reading cached ones
+current_force_refresh = contextvars.ContextVar("current_force_refresh", default=False)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (~4 characters per token), good enough for accounting."""
+    return (len(text) + 3) // 4
+
+
+class TokenUsage:
+    """Tokens of document text handed to agents, grouped by job, stage and tool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+
+    def record(self, tool: str, text: str):
+        job, stage = current_job.get(), current_stage.get() or "unscoped"
+        with self._lock:
+            self._usage[job][stage][tool] += estimate_tokens(text)
+
+    def pop_job(self, job_id: str) -> dict:
+        """Return and forget the usage recorded for `job_id` as {stage: {tool: tokens}}."""
+        with self._lock:
+            usage = self._usage.pop(job_id, {})
+        return {stage: dict(tools) for stage, tools in usage.items()}
+
+
+token_usage = TokenUsage()
+
+
+# ---------------------------------------------------------------------------
+# Timed spans (job / queue / step / task / tool / llm)
+# ---------------------------------------------------------------------------
+# Histogram bucket upper bounds, in seconds
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Per-job spans older than this are deleted (0 keeps them forever); /metrics totals are kept
+JOB_METRICS_RETENTION_DAYS = float(os.getenv("JOB_METRICS_RETENTION_DAYS", "30"))
+_PRUNE_INTERVAL_SECONDS = 3600
+
+
+class JobMetrics:
+    """
+    In-memory buffer of timed spans per job.
+
+    Spans are cheap to record on the hot path (tool and LLM calls); the worker
+    writes a job's spans to the `job_metrics` table in one batch when it ends,
+    and adds them to the running `span_totals` behind /metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = defaultdict(list)
+        self._pruned_at = 0.0
+
+    def record(self, kind: str, name: str, seconds: float, tokens_in: int = None,
+               tokens_out: int = None, job_id: str = None):
+        span = {
+            "kind": kind,
+            "name": name,
+            "stage": current_stage.get(),
+            "duration_ms": round(seconds * 1000, 3),
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+        }
+        with self._lock:
+            self._spans[job_id or current_job.get()].append(span)
+
+    @contextmanager
+    def timed(self, kind: str, name: str):
+        """Record the duration of the `with` block as a span of the current job."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(kind, name, time.perf_counter() - start)
+
+    def pop_job(self, job_id: str) -> list:
+        with self._lock:
+            return self._spans.pop(job_id, [])
+
+    def flush(self, db, job_id: str):
+        """Persist and forget the spans recorded for `job_id` (no-op outside a job)."""
+        from database import JobMetric
+
+        spans = self.pop_job(job_id)
+        if job_id is None or not spans:
+            return
+        db.add_all([JobMetric(job_id=job_id, **span) for span in spans])
+        db.commit()
+        _add_to_totals(db, spans)
+        self._prune(db)
+
+    def _prune(self, db):
+        """Delete spans past the retention period, at most once per interval per process."""
+        now = time.monotonic()
+        with self._lock:
+            if JOB_METRICS_RETENTION_DAYS <= 0 or now - self._pruned_at < _PRUNE_INTERVAL_SECONDS:
+                return
+            self._pruned_at = now
+        from database import JobMetric
+
+        cutoff = datetime.utcnow() - timedelta(days=JOB_METRICS_RETENTION_DAYS)
+        deleted = db.query(JobMetric).filter(JobMetric.created_at < cutoff).delete(synchronize_session=False)
+        db.commit()
+        if deleted:
+            logger.info("Pruned %d job metric spans older than %s days", deleted, JOB_METRICS_RETENTION_DAYS)
+
+
+job_metrics = JobMetrics()
+
+
+def _add_to_totals(db, spans: list):
+    """Add spans to the running per-bucket totals, with atomic increments shared by all workers."""
+    from sqlalchemy.exc import IntegrityError
+    from database import SpanTotal
+
+    totals = defaultdict(lambda: [0, 0.0, 0, 0])
+    for span in spans:
+        bucket = bisect.bisect_left(DURATION_BUCKETS, span["duration_ms"] / 1000)
+        total = totals[(span["kind"], span["name"], bucket)]
+        total[0] += 1
+        total[1] += span["duration_ms"]
+        total[2] += span["tokens_in"] or 0
+        total[3] += span["tokens_out"] or 0
+
+    for (kind, name, bucket), (count, duration_ms, tokens_in, tokens_out) in totals.items():
+        series = db.query(SpanTotal).filter(
+            SpanTotal.kind == kind, SpanTotal.name == name, SpanTotal.bucket == bucket,
+        )
+        increments = {
+            SpanTotal.count: SpanTotal.count + count,
+            SpanTotal.duration_ms: SpanTotal.duration_ms + duration_ms,
+            SpanTotal.tokens_in: SpanTotal.tokens_in + tokens_in,
+            SpanTotal.tokens_out: SpanTotal.tokens_out + tokens_out,
+        }
+        if series.update(increments, synchronize_session=False):
+            continue
+        # New series: keep the increments so far, then create it (rare, once per series)
+        db.commit()
+        try:
+            db.add(SpanTotal(
+                kind=kind, name=name, bucket=bucket, count=count,
+                duration_ms=duration_ms, tokens_in=tokens_in, tokens_out=tokens_out,
+            ))
+            db.commit()
+        except IntegrityError:
+            # Another worker created it first
+            db.rollback()
+            series.update(increments, synchronize_session=False)
+    db.commit()
+
+
+def summarize_job_metrics(db, job_id: str) -> dict:
+    """
+    Break a job's recorded time down per pipeline stage.
+
+    `throttle_s` is time spent waiting for the shared LLM rate limiter, and
+    `other_s` the task time not spent in LLM calls, tool calls or throttling.
+    `search_cache` counts web-search lookups served from the result cache.
+    """
+    from database import JobMetric
+
+    spans = db.query(JobMetric).filter(JobMetric.job_id == job_id).all()
+    if not spans:
+        return None
+
+    summary = {
+        "queue_wait_s": None, "total_s": None, "attempts": 0, "throttle_s": None,
+        "steps": {}, "tasks": {}, "tools": {}, "llm": {}, "search_cache": None,
+    }
+    search = {"hit": 0, "coalesced": 0, "miss": 0}
+    tasks = defaultdict(lambda: {
+        "duration_s": 0.0, "llm_s": 0.0, "llm_calls": 0, "tool_s": 0.0, "tool_calls": 0, "throttle_s": 0.0,
+    })
+    for span in spans:
+        seconds = span.duration_ms / 1000
+        if span.kind == "queue":
+            summary["queue_wait_s"] = round(seconds, 3)
+        elif span.kind == "job":
+            # One span per attempt; retries add up
+            summary["attempts"] += 1
+            summary["total_s"] = round((summary["total_s"] or 0.0) + seconds, 3)
+        elif span.kind == "step":
+            summary["steps"][span.name] = round(summary["steps"].get(span.name, 0.0) + seconds, 3)
+        elif span.kind == "task":
+            tasks[span.name]["duration_s"] += seconds
+        elif span.kind == "throttle":
+            if span.stage:
+                tasks[span.stage]["throttle_s"] += seconds
+            summary["throttle_s"] = round((summary["throttle_s"] or 0.0) + seconds, 3)
+        elif span.kind == "search":
+            search[span.name] = search.get(span.name, 0) + 1
+        elif span.kind in ("tool", "llm"):
+            if span.stage:
+                tasks[span.stage][f"{span.kind}_s"] += seconds
+                tasks[span.stage][f"{span.kind}_calls"] += 1
+            if span.kind == "tool":
+                bucket = summary["tools"].setdefault(span.name, {"calls": 0, "total_s": 0.0})
+            else:
+                bucket = summary["llm"].setdefault(
+                    span.name, {"calls": 0, "total_s": 0.0, "tokens_in": 0, "tokens_out": 0}
+                )
+                bucket["tokens_in"] += span.tokens_in or 0
+                bucket["tokens_out"] += span.tokens_out or 0
+            bucket["calls"] += 1
+            bucket["total_s"] += seconds
+
+    for name, task in tasks.items():
+        task["other_s"] = max(0.0, task["duration_s"] - task["llm_s"] - task["tool_s"] - task["throttle_s"])
+        summary["tasks"][name] = {k: round(v, 3) if isinstance(v, float) else v for k, v in task.items()}
+    for group in (summary["tools"], summary["llm"]):
+        for bucket in group.values():
+            bucket["total_s"] = round(bucket["total_s"], 3)
+    lookups = sum(search.values())
+    if lookups:
+        summary["search_cache"] = {
+            "lookups": lookups,
+            "hits": search["hit"],
+            "coalesced": search["coalesced"],
+            "hit_rate": round((search["hit"] + search["coalesced"]) / lookups, 3),
+        }
+    return summary
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus(db) -> str:
+    """
+    Render span histograms and job status counts in the Prometheus text exposition format.
+
+    Histograms come from the running `span_totals` (one row per series and
+    bucket, updated as jobs finish), so a scrape reads a table whose size
+    depends on the number of (kind, name) series, not on how many spans were
+    ever recorded. Job counts are a GROUP BY over `analysis_jobs`.
+    """
+    from sqlalchemy import func
+    from database import AnalysisJob, SpanTotal
+
+    series = {}
+    for row in db.query(SpanTotal).order_by(SpanTotal.kind, SpanTotal.name, SpanTotal.bucket):
+        entry = series.setdefault((row.kind, row.name), {"buckets": [0] * (len(DURATION_BUCKETS) + 1),
+                                                          "duration_ms": 0.0, "tokens_in": 0, "tokens_out": 0})
+        entry["buckets"][min(row.bucket, len(DURATION_BUCKETS))] += row.count or 0
+        entry["duration_ms"] += row.duration_ms or 0.0
+        entry["tokens_in"] += row.tokens_in or 0
+        entry["tokens_out"] += row.tokens_out or 0
+
+    lines = [
+        "# HELP fda_span_duration_seconds Time spent per job, queue wait, pipeline step, task, tool and LLM call,"
+        " waiting for the LLM rate limiter (throttle) and web-search cache lookups (search: hit, coalesced, miss).",
+        "# TYPE fda_span_duration_seconds histogram",
+    ]
+    token_lines = []
+    for (kind, name), entry in series.items():
+        labels = f'kind="{_label(kind)}",name="{_label(name)}"'
+        cumulative = 0
+        for le, count in zip(DURATION_BUCKETS, entry["buckets"]):
+            cumulative += count
+            lines.append(f'fda_span_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+        count = cumulative + entry["buckets"][-1]
+        lines.append(f'fda_span_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f"fda_span_duration_seconds_sum{{{labels}}} {entry['duration_ms'] / 1000:.6f}")
+        lines.append(f"fda_span_duration_seconds_count{{{labels}}} {count}")
+        if kind == "llm":
+            token_lines.append(f'fda_llm_tokens_total{{name="{_label(name)}",direction="in"}} {entry["tokens_in"]}')
+            token_lines.append(f'fda_llm_tokens_total{{name="{_label(name)}",direction="out"}} {entry["tokens_out"]}')
+
+    lines += [
+        "# HELP fda_llm_tokens_total Estimated LLM prompt (in) and completion (out) tokens.",
+        "# TYPE fda_llm_tokens_total counter",
+        *token_lines,
+        "# HELP fda_jobs Analysis jobs by status.",
+        "# TYPE fda_jobs gauge",
+    ]
+    for status, count in db.query(AnalysisJob.status, func.count(AnalysisJob.id)).group_by(AnalysisJob.status):
+        lines.append(f'fda_jobs{{status="{_label(status)}"}} {count}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,136 @@
+## PDF page text extraction: lazy iteration and process-parallel bulk extraction
+import os
+import math
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+
+def _available_cpus() -> int:
+    # Respect container/affinity limits where the platform exposes them
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(_available_cpus(), 8))))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+
+# Each worker gets at least this many pages so process start-up is amortised
+_MIN_PAGES_PER_WORKER = 10
+
+
+def _page_text(page) -> str:
+    return page.extract_text() or ""
+
+
+def count_pages(file_path: str) -> int:
+    """Number of pages in the PDF (reads the page tree, not the page contents)."""
+    return len(PdfReader(file_path).pages)
+
+
+def iter_pages(file_path: str, start: int = 0, stop: int = None):
+    """
+    Lazily yield the text of pages [start, stop) in order.
+
+    Pages are only parsed as the generator is consumed, so callers that need
+    just the first few pages don't pay for the rest of the document.
+    """
+    reader = PdfReader(file_path)
+    total = len(reader.pages)
+    stop = total if stop is None else min(stop, total)
+    for index in range(start, stop):
+        yield _page_text(reader.pages[index])
+
+
+def _extract_range(args) -> list:
+    file_path, start, stop = args
+    return list(iter_pages(file_path, start, stop))
+
+
+def _page_ranges(total: int, parts: int) -> list:
+    size = math.ceil(total / parts)
+    return [(start, min(start + size, total)) for start in range(0, total, size)]
+
+
+def _pool_context(mp=multiprocessing):
+    # Workers may run crew stages in threads; avoid plain fork from a threaded process
+    if "forkserver" in mp.get_all_start_methods():
+        ctx = mp.get_context("forkserver")
+        # Children fork from a server that has already imported pypdf
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+    return mp.get_context("spawn")
+
+
+def _extract_to_pipe(conn, file_path: str, start: int, stop: int):
+    try:
+        conn.send(list(iter_pages(file_path, start, stop)))
+    finally:
+        conn.close()
+
+
+def _extract_in_processes(ctx, ranges: list) -> list:
+    """One short-lived process per range, results received over pipes in range order."""
+    jobs = []
+    try:
+        for file_path, start, stop in ranges:
+            receiver, sender = ctx.Pipe(duplex=False)
+            process = ctx.Process(target=_extract_to_pipe, args=(sender, file_path, start, stop), daemon=True)
+            jobs.append((process, receiver))
+            process.start()
+            sender.close()
+        # Receive before joining: a child blocks until its pipe is drained. EOFError if it died.
+        return [receiver.recv() for _, receiver in jobs]
+    finally:
+        for process, receiver in jobs:
+            receiver.close()
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+
+def _map_ranges(file_path: str, total: int, workers: int) -> list:
+    """Extract page ranges in parallel, returning one list of page texts per range, in order."""
+    if multiprocessing.current_process().daemon:
+        # Celery prefork children are daemonic and the stdlib refuses to start children from
+        # them; billiard (Celery's multiprocessing fork) does not. Its Pool can take ~30s to
+        # shut down, so one process per range is started directly instead.
+        import billiard
+
+        ranges = [(file_path, start, stop) for start, stop in _page_ranges(total, workers)]
+        return _extract_in_processes(_pool_context(billiard), ranges)
+
+    # Twice as many ranges as workers evens out pages of very different complexity
+    ranges = [(file_path, start, stop) for start, stop in _page_ranges(total, workers * 2)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+        # map() yields results in submission order, i.e. page order
+        return list(pool.map(_extract_range, ranges))
+
+
+def extract_pages(file_path: str, workers: int = None) -> list:
+    """
+    Extract the text of every page, splitting page ranges across a process pool.
+
+    Inside a Celery prefork child the pool comes from billiard. Small documents
+    (fewer than PDF_PARALLEL_MIN_PAGES pages) use serial extraction, as do
+    environments where no pool can be started (logged as a warning). Results
+    are always returned in page order.
+    """
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    total = count_pages(file_path)
+    workers = min(workers, total // _MIN_PAGES_PER_WORKER)
+
+    if total < PDF_PARALLEL_MIN_PAGES or workers <= 1:
+        return list(iter_pages(file_path))
+
+    try:
+        return [text for part in _map_ranges(file_path, total, workers) for text in part]
+    except (AssertionError, ImportError, EOFError, OSError, BrokenProcessPool) as exc:
+        logger.warning("Parallel PDF extraction unavailable (%r); extracting %d pages serially", exc, total)
+        return list(iter_pages(file_path))
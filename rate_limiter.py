@@ -0,0 +1,270 @@
+## Shared, priority-aware token-bucket limiter for LLM provider calls
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Provider quota shared by every worker process (requests per minute; 0 disables limiting)
+LLM_RPM = float(os.getenv("LLM_RPM", "15"))
+# Requests that may go out back-to-back after an idle period
+LLM_BURST = int(os.getenv("LLM_BURST", "3"))
+# auto -> Redis when REDIS_URL is a redis:// URL, else a SQLite file shared by local processes
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "auto").lower()
+RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH", "cache/rate_limiter.db")
+
+# A waiter that has not polled for this long belongs to a dead process and is dropped
+_STALE_AFTER = 30.0
+# Longest a waiter sleeps between polls while others are ahead of it
+_MAX_POLL = 0.25
+
+
+class RateLimitTimeout(RuntimeError):
+    """Raised when a request could not be admitted within its timeout."""
+
+
+class SQLiteRateLimiter:
+    """
+    Token bucket with a fair waiting queue, kept in a SQLite file so every
+    process on the host shares one quota.
+
+    Waiters are served by highest priority first; within a priority, the job
+    that was served least recently goes first, so concurrent jobs take turns
+    instead of one job draining the bucket. Each decision runs inside
+    BEGIN IMMEDIATE, which serialises competing processes.
+    """
+
+    def __init__(self, rpm: float = LLM_RPM, burst: int = LLM_BURST, path: str = RATE_LIMIT_PATH,
+                 name: str = "llm"):
+        self.rate = rpm / 60.0
+        self.capacity = max(1, burst)
+        self.path = path
+        self.name = name
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS waiters (ticket TEXT PRIMARY KEY, name TEXT, job_id TEXT,"
+                " priority INTEGER, enqueued REAL, heartbeat REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS grants (name TEXT, job_id TEXT, last_grant REAL,"
+                " PRIMARY KEY (name, job_id))"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _try_acquire(self, conn, ticket: str, now: float):
+        """One admission attempt. Returns (granted, seconds to sleep before retrying)."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)).fetchone()
+            tokens = self.capacity if row is None else min(
+                self.capacity, row[0] + max(0.0, now - row[1]) * self.rate
+            )
+            conn.execute("DELETE FROM waiters WHERE name = ? AND heartbeat < ?", (self.name, now - _STALE_AFTER))
+            head = conn.execute(
+                "SELECT w.ticket, w.job_id FROM waiters w"
+                " LEFT JOIN grants g ON g.name = w.name AND g.job_id = w.job_id"
+                " WHERE w.name = ?"
+                " ORDER BY w.priority DESC, COALESCE(g.last_grant, 0) ASC, w.enqueued ASC, w.ticket ASC"
+                " LIMIT 1",
+                (self.name,),
+            ).fetchone()
+
+            if head and head[0] == ticket and tokens >= 1:
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                    (self.name, tokens - 1, now),
+                )
+                conn.execute("DELETE FROM waiters WHERE ticket = ?", (ticket,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO grants (name, job_id, last_grant) VALUES (?, ?, ?)",
+                    (self.name, head[1], now),
+                )
+                conn.execute("COMMIT")
+                return True, 0.0
+
+            conn.execute("UPDATE waiters SET heartbeat = ? WHERE ticket = ?", (now, ticket))
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (self.name, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if head and head[0] == ticket:
+            # Next in line: sleep until the bucket holds a whole token
+            return False, max(0.01, (1 - tokens) / self.rate)
+        return False, min(_MAX_POLL, max(0.01, (1 - tokens) / self.rate))
+
+    def acquire(self, job_id: str = None, priority: int = 0, timeout: float = None) -> float:
+        """
+        Block until a request may be sent; returns the seconds spent waiting.
+
+        Raises:
+            RateLimitTimeout: if not admitted within `timeout` seconds.
+        """
+        conn = self._conn()
+        ticket = uuid.uuid4().hex
+        start = time.time()
+        conn.execute(
+            "INSERT INTO waiters (ticket, name, job_id, priority, enqueued, heartbeat) VALUES (?, ?, ?, ?, ?, ?)",
+            (ticket, self.name, job_id or ticket, int(priority), start, start),
+        )
+        try:
+            while True:
+                now = time.time()
+                granted, sleep_for = self._try_acquire(conn, ticket, now)
+                if granted:
+                    return now - start
+                if timeout is not None and now - start + sleep_for > timeout:
+                    raise RateLimitTimeout(f"No LLM request slot within {timeout:.0f}s")
+                time.sleep(sleep_for)
+        except BaseException:
+            conn.execute("DELETE FROM waiters WHERE ticket = ?", (ticket,))
+            raise
+
+    def penalize(self, seconds: float):
+        """Empty the bucket for `seconds` after the provider answers 429, so no process keeps hammering it."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+            (self.name, -seconds * self.rate, time.time()),
+        )
+        conn.execute("COMMIT")
+
+
+# KEYS: bucket hash, waiters hash, grants hash
+# ARGV: ticket, job_id, priority, rate per second, capacity, stale_after
+_REDIS_ACQUIRE = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1e6
+local ticket, job, priority = ARGV[1], ARGV[2], tonumber(ARGV[3])
+local rate, capacity, stale = tonumber(ARGV[4]), tonumber(ARGV[5]), tonumber(ARGV[6])
+
+local waiter = redis.call('HGET', KEYS[2], ticket)
+local enqueued = now
+if waiter then enqueued = cjson.decode(waiter)['enqueued'] end
+redis.call('HSET', KEYS[2], ticket, cjson.encode({job=job, priority=priority, enqueued=enqueued, heartbeat=now}))
+
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or capacity)
+local updated = tonumber(redis.call('HGET', KEYS[1], 'updated') or now)
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+
+local best, best_key = nil, nil
+local entries = redis.call('HGETALL', KEYS[2])
+for i = 1, #entries, 2 do
+  local w = cjson.decode(entries[i + 1])
+  if w['heartbeat'] < now - stale then
+    redis.call('HDEL', KEYS[2], entries[i])
+  else
+    local key = {-w['priority'], tonumber(redis.call('HGET', KEYS[3], w['job']) or 0), w['enqueued'], entries[i]}
+    local better = best_key == nil
+    if not better then
+      for j = 1, 4 do
+        if key[j] ~= best_key[j] then better = key[j] < best_key[j]; break end
+      end
+    end
+    if better then best, best_key = entries[i], key end
+  end
+end
+
+if best == ticket and tokens >= 1 then
+  redis.call('HSET', KEYS[1], 'tokens', tokens - 1, 'updated', now)
+  redis.call('HDEL', KEYS[2], ticket)
+  redis.call('HSET', KEYS[3], job, now)
+  redis.call('EXPIRE', KEYS[3], 86400)
+  return {1, '0'}
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+local wait = math.max(0.01, (1 - tokens) / rate)
+if best ~= ticket then wait = math.min(wait, 0.25) end
+return {0, tostring(wait)}
+"""
+
+
+class RedisRateLimiter:
+    """
+    The same bucket and fair queue as SQLiteRateLimiter, held in Redis and
+    updated by a Lua script so every worker host shares one quota.
+
+    Raises on construction if Redis is unreachable.
+    """
+
+    def __init__(self, rpm: float = LLM_RPM, burst: int = LLM_BURST, url: str = REDIS_URL, name: str = "llm"):
+        import redis
+
+        self.rate = rpm / 60.0
+        self.capacity = max(1, burst)
+        self._client = redis.Redis.from_url(url, socket_connect_timeout=2)
+        # from_url() does not connect; fail here rather than on every LLM call
+        self._client.ping()
+        self._script = self._client.register_script(_REDIS_ACQUIRE)
+        base = f"fda:ratelimit:{name}"
+        self._keys = [f"{base}:bucket", f"{base}:waiters", f"{base}:grants"]
+
+    def acquire(self, job_id: str = None, priority: int = 0, timeout: float = None) -> float:
+        ticket = uuid.uuid4().hex
+        start = time.time()
+        try:
+            while True:
+                granted, wait = self._script(
+                    keys=self._keys,
+                    args=[ticket, job_id or ticket, int(priority), self.rate, self.capacity, _STALE_AFTER],
+                )
+                now = time.time()
+                if int(granted):
+                    return now - start
+                sleep_for = float(wait)
+                if timeout is not None and now - start + sleep_for > timeout:
+                    raise RateLimitTimeout(f"No LLM request slot within {timeout:.0f}s")
+                time.sleep(sleep_for)
+        except BaseException:
+            self._client.hdel(self._keys[1], ticket)
+            raise
+
+    def penalize(self, seconds: float):
+        self._client.hset(self._keys[0], mapping={"tokens": -seconds * self.rate, "updated": time.time()})
+
+
+class _Unlimited:
+    def acquire(self, job_id: str = None, priority: int = 0, timeout: float = None) -> float:
+        return 0.0
+
+    def penalize(self, seconds: float):
+        pass
+
+
+def _make_limiter():
+    if LLM_RPM <= 0:
+        return _Unlimited()
+    if RATE_LIMIT_BACKEND == "redis" or (
+        RATE_LIMIT_BACKEND == "auto" and REDIS_URL.startswith(("redis://", "rediss://"))
+    ):
+        try:
+            return RedisRateLimiter()
+        except ImportError:
+            logger.warning("redis is not installed; the LLM rate limiter falls back to %s", RATE_LIMIT_PATH)
+        except Exception as exc:
+            logger.warning(
+                "Redis is unreachable (%s); the LLM rate limiter falls back to %s, shared by this host only",
+                exc, RATE_LIMIT_PATH,
+            )
+    return SQLiteRateLimiter()
+
+
+llm_rate_limiter = _make_limiter()
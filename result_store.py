@@ -0,0 +1,131 @@
+## Compressed storage of analysis reports, with large reports offloaded to disk
+import os
+import zlib
+import codecs
+import hashlib
+import logging
+import tempfile
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# auto -> zstd when the zstandard package is installed, else gzip
+RESULT_CODEC = os.getenv("RESULT_CODEC", "auto").lower()
+# Compressed reports larger than this are written to RESULT_STORE_DIR instead of the database (0 keeps all inline)
+RESULT_OFFLOAD_KB = int(os.getenv("RESULT_OFFLOAD_KB", "256"))
+RESULT_STORE_DIR = os.getenv("RESULT_STORE_DIR", "results")
+
+_READ_CHUNK_SIZE = 64 * 1024
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _pick_codec() -> str:
+    if RESULT_CODEC in ("auto", "zstd") and zstandard is not None:
+        return "zstd"
+    if RESULT_CODEC == "zstd":
+        logger.warning("zstandard is not installed; analysis results are stored gzip-compressed")
+    return "gzip"
+
+
+CODEC = _pick_codec()
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)      # wbits 31 -> gzip container
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decompressor(codec: str):
+    """Incremental decompressor for `codec`, exposing a zlib-style `decompress(chunk)`."""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This result is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)
+
+
+def _blob_path(key: str) -> str:
+    return os.path.join(RESULT_STORE_DIR, key)
+
+
+def _write_blob(key: str, payload: bytes):
+    """Write a content-addressed blob atomically; identical reports share one file."""
+    path = _blob_path(key)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def store_result(job, text: str):
+    """
+    Set the result columns of `job` for the report `text`.
+
+    The report is compressed with CODEC and kept in `result_blob`, or, when the
+    compressed size exceeds RESULT_OFFLOAD_KB, written to RESULT_STORE_DIR under
+    its SHA-256 and referenced by `result_path`.
+    """
+    data = text.encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    payload = _compress(data, CODEC)
+
+    job.result = None
+    job.result_codec = CODEC
+    job.result_sha256 = digest
+    job.result_size = len(data)
+    if RESULT_OFFLOAD_KB and len(payload) > RESULT_OFFLOAD_KB * 1024:
+        key = f"{digest[:2]}/{digest}.{CODEC}"
+        _write_blob(key, payload)
+        job.result_blob = None
+        job.result_path = key
+    else:
+        job.result_blob = payload
+        job.result_path = None
+
+
+def iter_result(codec: str, blob: bytes = None, path: str = None, legacy_text: str = None):
+    """
+    Yield the report as text chunks, decompressing incrementally.
+
+    Args:
+        codec:       `result_codec` of the job (None for reports stored before compression).
+        blob:        `result_blob`, for reports stored inline.
+        path:        `result_path`, for reports offloaded to RESULT_STORE_DIR.
+        legacy_text: `result`, for uncompressed reports from older versions.
+    """
+    if not codec:
+        if legacy_text:
+            yield legacy_text
+        return
+
+    decompressor = _decompressor(codec)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    if path:
+        with open(_blob_path(path), "rb") as f:
+            for chunk in iter(lambda: f.read(_READ_CHUNK_SIZE), b""):
+                text = decoder.decode(decompressor.decompress(chunk))
+                if text:
+                    yield text
+    elif blob:
+        for start in range(0, len(blob), _READ_CHUNK_SIZE):
+            text = decoder.decode(decompressor.decompress(blob[start:start + _READ_CHUNK_SIZE]))
+            if text:
+                yield text
+    tail = decoder.decode(decompressor.flush(), final=True)
+    if tail:
+        yield tail
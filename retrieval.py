@@ -0,0 +1,170 @@
+## Page- and section-aware chunking with a local BM25 index
+import os
+import re
+import math
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass
+
+CHUNK_TARGET_WORDS = int(os.getenv("RETRIEVAL_CHUNK_WORDS", "220"))
+INDEX_CACHE_MAX_ITEMS = int(os.getenv("RETRIEVAL_INDEX_CACHE_ITEMS", "16"))
+
+# BM25 parameters (standard Okapi defaults)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+
+# Headings commonly found in financial filings; short matching lines start a new section
+_KNOWN_HEADINGS = re.compile(
+    r"^(consolidated\s+)?(condensed\s+)?("
+    r"balance sheets?|statements? of (financial position|operations|income|comprehensive income|"
+    r"cash flows?|changes in (stockholders'?|shareholders'?) equity)|income statements?|"
+    r"cash flows?|risk factors|management'?s discussion and analysis|"
+    r"notes to (the )?(consolidated )?financial statements|financial summary|highlights|"
+    r"outlook|liquidity and capital resources|results of operations|segment information|"
+    r"forward[- ]looking statements|non-gaap financial measures|guidance"
+    r")\b",
+    re.IGNORECASE,
+)
+
+
+def _stem(token: str) -> str:
+    # Plural folding only ("sheets" -> "sheet", "liabilities" -> "liability"); keeps it predictable
+    if len(token) > 4 and token.isalpha():
+        if token.endswith("ies"):
+            return token[:-3] + "y"
+        if token.endswith("s") and not token.endswith("ss"):
+            return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list:
+    """Lower-case word/number tokens; keeps figures such as 25,500 or 3.14 intact."""
+    return [_stem(token) for token in _TOKEN_RE.findall(text.lower())]
+
+
+def _is_heading(line: str) -> bool:
+    words = line.split()
+    if not words or len(words) > 10 or line.endswith((".", ",", ";")):
+        return False
+    if _KNOWN_HEADINGS.match(line):
+        return True
+    # Short all-caps lines with few digits are usually section titles
+    letters = [c for c in line if c.isalpha()]
+    digits = sum(c.isdigit() for c in line)
+    return len(letters) >= 4 and line.upper() == line and digits <= 4
+
+
+@dataclass
+class Chunk:
+    page: int            # 1-based page number
+    section: str         # Nearest preceding heading ("" if none yet)
+    text: str
+
+
+def chunk_pages(pages: list, target_words: int = CHUNK_TARGET_WORDS) -> list:
+    """
+    Split page texts into chunks of roughly `target_words` words.
+
+    Chunks never span pages, and a new chunk starts at every detected heading
+    so each one carries a single section label. The section label carries over
+    page breaks until the next heading.
+    """
+    chunks = []
+    section = ""
+    for page_no, page in enumerate(pages, start=1):
+        buf, words = [], 0
+
+        def flush():
+            nonlocal buf, words
+            if buf:
+                chunks.append(Chunk(page=page_no, section=section, text="\n".join(buf)))
+            buf, words = [], 0
+
+        for raw in page.splitlines():
+            line = raw.strip()
+            if not line:
+                continue
+            if _is_heading(line):
+                flush()
+                section = line
+            buf.append(line)
+            words += len(line.split())
+            if words >= target_words:
+                flush()
+        flush()
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 over a document's chunks, with an inverted index for sparse scoring."""
+
+    def __init__(self, chunks: list):
+        self.chunks = chunks
+        self._postings = defaultdict(list)      # term -> [(chunk_idx, tf), ...]
+        self._lengths = []
+        for idx, chunk in enumerate(chunks):
+            # Index the section label with the body so heading queries hit every chunk in it
+            terms = tokenize(f"{chunk.section}\n{chunk.text}")
+            self._lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self._postings[term].append((idx, tf))
+
+        n = len(chunks)
+        self._avg_len = (sum(self._lengths) / n) if n else 0.0
+        self._idf = {
+            term: math.log(1 + (n - len(posts) + 0.5) / (len(posts) + 0.5))
+            for term, posts in self._postings.items()
+        }
+
+    def search(self, query: str, top_k: int = 5) -> list:
+        """Return up to `top_k` (score, Chunk) pairs, best first."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for idx, tf in self._postings[term]:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[idx] / (self._avg_len or 1))
+                scores[idx] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        return [(score, self.chunks[idx]) for idx, score in best]
+
+
+class _IndexCache:
+    """Bounded LRU of BM25 indexes keyed on the document content hash."""
+
+    def __init__(self, max_items: int = INDEX_CACHE_MAX_ITEMS):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: str, pages: list) -> BM25Index:
+        with self._lock:
+            index = self._items.get(key)
+            if index is not None:
+                self._items.move_to_end(key)
+                return index
+
+        index = BM25Index(chunk_pages(pages))
+        with self._lock:
+            self._items[key] = index
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return index
+
+
+index_cache = _IndexCache()
+
+
+def format_passages(results: list) -> str:
+    """Render search hits as labelled passages for an agent's context."""
+    if not results:
+        return "No matching passages found in the document."
+    blocks = []
+    for _, chunk in results:
+        label = f"[Page {chunk.page}" + (f" | {chunk.section}]" if chunk.section else "]")
+        blocks.append(f"{label}\n{chunk.text}")
+    return "\n\n".join(blocks)
@@ -0,0 +1,167 @@
+## Dependency-aware stage scheduler for the crew pipeline
+import time
+import logging
+import contextvars
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    """One unit of the pipeline, runnable once every stage in `depends_on` has finished."""
+    name: str
+    task: object
+    depends_on: tuple = ()
+
+
+@dataclass
+class StageRun:
+    """Outcome of a scheduled pipeline run."""
+    outputs: dict = field(default_factory=dict)     # stage name -> output text
+    timings: dict = field(default_factory=dict)     # stage name -> seconds
+    skipped: list = field(default_factory=list)     # stages not run because a gate failed
+    resumed: list = field(default_factory=list)     # stages whose output was supplied (checkpoint or triage), not run
+    wall_seconds: float = 0.0
+
+    def timing_report(self) -> dict:
+        """Per-stage timings plus the wall-clock vs. sequential totals, rounded for storage."""
+        sequential = sum(self.timings.values())
+        return {
+            "stages": {name: round(secs, 3) for name, secs in self.timings.items()},
+            "skipped": list(self.skipped),
+            "resumed": list(self.resumed),
+            "wall_seconds": round(self.wall_seconds, 3),
+            "sequential_seconds": round(sequential, 3),
+            "parallel_saving": round(1 - self.wall_seconds / sequential, 3) if sequential else 0.0,
+        }
+
+
+def _validate(stages: list):
+    names = {stage.name for stage in stages}
+    if len(names) != len(stages):
+        raise ValueError("Stage names must be unique")
+    for stage in stages:
+        unknown = set(stage.depends_on) - names
+        if unknown:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {sorted(unknown)}")
+
+    # Kahn's algorithm: every stage must be reachable in topological order
+    remaining = {stage.name: set(stage.depends_on) for stage in stages}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Stage dependencies contain a cycle: {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def _dependents(stages: list, root: str) -> set:
+    """All stages that transitively depend on `root`."""
+    found = set()
+    frontier = {root}
+    while frontier:
+        nxt = {s.name for s in stages if frontier & set(s.depends_on)} - found
+        found |= nxt
+        frontier = nxt
+    return found
+
+
+def run_stages(
+    stages: list,
+    execute,
+    gate=None,
+    max_workers: int = None,
+    on_start=None,
+    on_complete=None,
+    on_skip=None,
+    completed: dict = None,
+) -> StageRun:
+    """
+    Run `stages` respecting their dependencies, executing independent ones concurrently.
+
+    Args:
+        stages:      List of Stage objects; order only matters for tie-breaking.
+        execute:     Callable `execute(stage) -> str` that runs one stage.
+        gate:        Optional `gate(stage, output) -> bool`. When it returns False,
+                     every stage depending on that one is skipped.
+        max_workers: Thread pool size (defaults to the number of stages).
+        on_start:    Optional `on_start(stage)`, called as each stage is submitted.
+        on_complete: Optional `on_complete(stage, output, seconds)`, called as each
+                     stage finishes (before its dependents start).
+        on_skip:     Optional `on_skip(stage)` for each stage skipped by the gate.
+        completed:   Optional `{stage name: output}` of stages whose output is already
+                     known (finished by an earlier attempt, or decided without an
+                     LLM). They are not run but count as finished, and the gate
+                     still applies to their outputs.
+
+    Callbacks run on the scheduling thread; keep them quick.
+
+    Raises:
+        The first exception raised by `execute`, after running stages have finished.
+    """
+    _validate(stages)
+    run = StageRun()
+    pending = {stage.name: stage for stage in stages}
+    finished = set()
+    started_at = {}
+    running = {}
+    start = time.perf_counter()
+
+    def apply_gate(stage, output):
+        if gate is not None and not gate(stage, output):
+            blocked = _dependents(stages, stage.name)
+            for other in stages:
+                if other.name in blocked and pending.pop(other.name, None) is not None:
+                    run.skipped.append(other.name)
+                    if on_skip is not None:
+                        on_skip(other)
+            logger.info("Stage %s gated; skipped %s", stage.name, run.skipped)
+
+    # Restore stages finished by an earlier attempt before anything is submitted
+    for stage in stages:
+        if completed and stage.name in completed and stage.name in pending:
+            del pending[stage.name]
+            run.outputs[stage.name] = completed[stage.name]
+            run.resumed.append(stage.name)
+            finished.add(stage.name)
+            apply_gate(stage, completed[stage.name])
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages) or 1) as pool:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if set(stage.depends_on) <= finished:
+                    del pending[name]
+                    started_at[name] = time.perf_counter()
+                    if on_start is not None:
+                        on_start(stage)
+                    # Copy the caller's context so job-scoped contextvars reach the stage threads
+                    ctx = contextvars.copy_context()
+                    running[pool.submit(ctx.run, execute, stage)] = stage
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                run.timings[stage.name] = time.perf_counter() - started_at[stage.name]
+                try:
+                    output = future.result()
+                except Exception:
+                    # Let stages already in flight finish, but start nothing new
+                    pending.clear()
+                    raise
+                run.outputs[stage.name] = output
+                finished.add(stage.name)
+                logger.info("Stage %s finished in %.2fs", stage.name, run.timings[stage.name])
+                if on_complete is not None:
+                    on_complete(stage, output, run.timings[stage.name])
+
+                apply_gate(stage, output)
+
+    run.wall_seconds = time.perf_counter() - start
+    return run
@@ -0,0 +1,133 @@
+## TTL + LRU cache for web search results, with coalescing of concurrent lookups
+import os
+import copy
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from retrieval import tokenize
+
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "3600"))
+SEARCH_CACHE_MAX_ITEMS = int(os.getenv("SEARCH_CACHE_MAX_ITEMS", "512"))
+# serper -> live Serper.dev API; stub -> deterministic offline results (tests, benchmarks, CI)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "serper").lower()
+SEARCH_STUB_DELAY = float(os.getenv("SEARCH_STUB_DELAY", "0"))
+
+# Words that change the phrasing of a query but not what a search engine returns for it
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it its of on or s the to what whats which with".split()
+)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form of a search query: case, punctuation, word order, plurals
+    and filler words are ignored, so "Tesla's latest earnings" and
+    "latest earnings of Tesla" share a cache entry.
+    """
+    text = unicodedata.normalize("NFKC", query or "")
+    return " ".join(sorted({token for token in tokenize(text) if token not in _STOPWORDS}))
+
+
+class SearchResultCache:
+    """
+    Bounded LRU of search results, each valid for `ttl` seconds.
+
+    Lookups for a key that is already being fetched wait for that fetch
+    instead of issuing their own, so concurrent agents asking the same
+    question cost one API call. Failed fetches are not cached.
+    """
+
+    def __init__(self, ttl: float = SEARCH_CACHE_TTL_SECONDS, max_items: int = SEARCH_CACHE_MAX_ITEMS):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items = OrderedDict()         # key -> (expires_at, result)
+        self._inflight = {}                 # key -> Future of the running fetch
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query: str, params: dict = None) -> str:
+        payload = normalize_query(query) + "\x00" + repr(sorted((params or {}).items()))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_or_fetch(self, query: str, fetch, params: dict = None):
+        """
+        Return `(result, outcome)` for `query`, calling `fetch()` on a miss.
+
+        `outcome` is "hit", "coalesced" (waited on another caller's fetch) or
+        "miss". Callers get their own copy of the result.
+        """
+        key = self.make_key(query, params)
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._items.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1]), "hit"
+            if entry is not None:
+                del self._items[key]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return copy.deepcopy(future.result()), "coalesced"
+
+        try:
+            result = fetch()
+        except BaseException as exc:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(exc)
+            raise
+        with self._lock:
+            del self._inflight[key]
+            if self.ttl > 0:
+                self._items[key] = (time.monotonic() + self.ttl, result)
+                while len(self._items) > self.max_items:
+                    self._items.popitem(last=False)
+        future.set_result(result)
+        return copy.deepcopy(result), "miss"
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process, plus the current number of cached queries."""
+        with self._lock:
+            lookups = self.hits + self.coalesced + self.misses
+            return {
+                "hits": self.hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else None,
+                "items": len(self._items),
+            }
+
+
+search_cache = SearchResultCache()
+
+
+def stub_search(search_query: str, n_results: int = 10, search_type: str = "search") -> dict:
+    """Deterministic Serper-shaped results for offline runs (SEARCH_BACKEND=stub)."""
+    if SEARCH_STUB_DELAY:
+        time.sleep(SEARCH_STUB_DELAY)
+    digest = hashlib.sha256(normalize_query(search_query).encode("utf-8")).hexdigest()
+    results = [
+        {
+            "title": f"Result {i + 1} for {search_query}",
+            "link": f"https://example.com/{digest[:12]}/{i + 1}",
+            "snippet": f"Offline stub result {i + 1} ({digest[i:i + 8]}) for the query: {search_query}.",
+            "position": i + 1,
+        }
+        for i in range(min(n_results, 5))
+    ]
+    key = "news" if search_type == "news" else "organic"
+    return {"searchParameters": {"q": search_query, "type": search_type}, key: results, "credits": 0}
@@ -2,7 +2,7 @@
 from crewai import Task
 
 from agents import financial_analyst, verifier, investment_advisor, risk_assessor
-from tools import search_tool, read_financial_document
+from tools import search_tool, read_financial_document, search_financial_document
 
 ## Task 1: Verify the document is a legitimate financial report
 verification = Task(
@@ -26,9 +26,14 @@ verification = Task(
 ## Task 2: Analyze the financial document in depth
 analyze_financial_document = Task(
     description="Thoroughly analyze the financial document at '{file_path}' to answer the user's query: {query}.\n"
-    "Extract and interpret key financial metrics including revenue, net income, margins, EPS, "
+    "Interpret key financial metrics including revenue, net income, margins, EPS, "
     "debt levels, cash flow, and any other relevant data points.\n"
+    "These figures were already parsed from the document's statement tables (absolute currency units, "
+    "periods oldest to newest, ratios and period-over-period changes precomputed); start from them "
+    "instead of re-reading the raw text:\n{financial_metrics}\n"
     "Identify trends, compare with prior periods where available, and highlight notable items.\n"
+    "Use the Financial Document Search tool with targeted queries (e.g. 'income statement', "
+    "'balance sheet', 'cash flow') to pull only the relevant passages; read the full document only if needed.\n"
     "Search the internet for current market context to enrich your analysis.",
 
     expected_output="""A comprehensive financial analysis report containing:
@@ -40,7 +45,8 @@ analyze_financial_document = Task(
 - Direct answers to the user's specific query""",
 
     agent=financial_analyst,
-    tools=[read_financial_document, search_tool],
+    tools=[search_financial_document, read_financial_document, search_tool],
+    context=[verification],
     async_execution=False,
 )
 
@@ -50,6 +56,8 @@ investment_analysis = Task(
     "Consider the financial health, growth prospects, valuation metrics, and competitive position "
     "revealed by the document. Address the user's query: {query}.\n"
     "Ensure all recommendations are data-driven, diversified, and include appropriate disclaimers.\n"
+    "Use the Financial Document Search tool (e.g. 'guidance', 'valuation', 'segment revenue') for any "
+    "figures not already covered by the prior analysis.\n"
     "Search the internet for current analyst ratings, price targets, and market sentiment.",
 
     expected_output="""A professional investment analysis containing:
@@ -61,7 +69,9 @@ investment_analysis = Task(
 - References to current analyst consensus and market data""",
 
     agent=investment_advisor,
-    tools=[read_financial_document, search_tool],
+    tools=[search_financial_document, search_tool],
+    # Depends only on verification + analysis, so it can run alongside risk_assessment
+    context=[verification, analyze_financial_document],
     async_execution=False,
 )
 
@@ -71,6 +81,8 @@ risk_assessment = Task(
     "Evaluate market risk, credit risk, liquidity risk, and operational risk factors.\n"
     "Assess the company's financial resilience and identify potential vulnerabilities.\n"
     "Address the user's query: {query} from a risk management perspective.\n"
+    "Use the Financial Document Search tool (e.g. 'risk factors', 'debt', 'liquidity') to pull the "
+    "relevant passages from the document.\n"
     "Search for any recent news or regulatory developments that could impact risk profile.",
 
     expected_output="""A structured risk assessment report containing:
@@ -83,6 +95,7 @@ risk_assessment = Task(
 - Regulatory and compliance risk factors""",
 
     agent=risk_assessor,
-    tools=[read_financial_document, search_tool],
+    tools=[search_financial_document, search_tool],
+    context=[verification, analyze_financial_document],
     async_execution=False,
 )
\ No newline at end of file
@@ -0,0 +1,39 @@
+from financial_metrics import extract_financial_metrics
+
+
+def _metrics(page: str) -> dict:
+    return extract_financial_metrics([page])["tables"][0]["metrics"]
+
+
+def test_share_counts_are_not_reported_as_eps():
+    page = "\n".join([
+        "Consolidated Statements of Operations (in millions, except per share data)",
+        "Q2-2025 Q2-2024",
+        "Total revenues 22,496 25,500",
+        "Weighted-average shares outstanding - basic 3,218 3,191",
+        "Weighted-average shares outstanding - diluted 3,521 3,481",
+        "Net income per share - basic $ 0.37 $ 0.42",
+        "Net income per share - diluted $ 0.33 $ 0.40",
+    ])
+    metrics = _metrics(page)
+
+    assert metrics["eps_basic"] == [0.42, 0.37]
+    assert metrics["eps_diluted"] == [0.40, 0.33]
+
+
+def test_bare_basic_and_diluted_rows_use_their_heading():
+    page = "\n".join([
+        "Consolidated Statements of Operations (in millions, except per share data)",
+        "Q2-2025 Q2-2024",
+        "Total revenues 22,496 25,500",
+        "Weighted average shares used in computing net income per share of common stock",
+        "Basic 3,218 3,191",
+        "Diluted 3,521 3,481",
+        "Net income per share of common stock attributable to common stockholders",
+        "Basic $ 0.37 $ 0.42",
+        "Diluted $ 0.33 $ 0.40",
+    ])
+    metrics = _metrics(page)
+
+    assert metrics["eps_basic"] == [0.42, 0.37]
+    assert metrics["eps_diluted"] == [0.40, 0.33]
@@ -0,0 +1,30 @@
+from text_normalize import normalize_pages
+
+
+def _statement_page(page_no: int, figure: str) -> str:
+    return "\n".join([
+        "Tesla Q2 2025 Update",
+        "Revenue by segment",
+        "Automotive sales and leasing",
+        figure,
+        f"Page {page_no} of 5",
+    ])
+
+
+def test_numeric_table_cells_at_page_edges_are_kept():
+    figures = ["903", "1035", "915", "1,204", "(87)"]
+    pages, stats = normalize_pages([_statement_page(i + 1, figure) for i, figure in enumerate(figures)])
+
+    for page, figure in zip(pages, figures):
+        assert figure in page.splitlines()
+    # The running header and page footer are still stripped after their first occurrence
+    assert sum("Tesla Q2 2025 Update" in page for page in pages) == 1
+    assert sum("Page" in page for page in pages) == 1
+    assert stats["lines_removed"] > 0
+
+
+def test_bare_page_numbers_are_stripped():
+    pages, _ = normalize_pages([f"Results of operations\nBody text {i}\n{i + 1}" for i in range(5)])
+
+    assert pages[0].splitlines()[-1] == "1"
+    assert all(page.splitlines()[-1].startswith("Body text") for page in pages[1:])
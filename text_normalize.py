@@ -0,0 +1,100 @@
+## Single-pass text normalisation and repeated header/footer stripping
+import re
+import math
+from collections import Counter
+
+from metrics import estimate_tokens
+
+# A line must recur on at least this share of pages (and on >= BOILERPLATE_MIN_PAGES pages)
+BOILERPLATE_MIN_RATIO = 0.5
+BOILERPLATE_MIN_PAGES = 3
+# Only the first/last EDGE_LINES lines of a page are header/footer candidates...
+EDGE_LINES = 3
+# ...unless the line is long enough to be a repeated disclaimer paragraph
+DISCLAIMER_MIN_CHARS = 80
+
+_DIGITS_RE = re.compile(r"\d+")
+_SPACE_RE = re.compile(r"\s+")
+_LETTER_RE = re.compile(r"[a-z]")
+# "Page 3", "Page 3 of 40", "p. 3/40", "3 of 40": the only lines whose numbers are masked
+_PAGE_LABEL_RE = re.compile(r"\b(page|p\.)\s*\d+(\s*(of|/)\s*\d+)?\b|^\d+\s*(of|/)\s*\d+$")
+_BARE_NUMBER_RE = re.compile(r"^[-\u2013\u2014 ]*(\d+)[-\u2013\u2014 ]*$")
+
+
+def _line_key(line: str, page_no: int):
+    """
+    Key under which a line counts as repeated across pages, or None if it is
+    never boilerplate. Lines made only of figures are table data, not page
+    furniture, so they never match each other.
+    """
+    key = _SPACE_RE.sub(" ", line).lower()
+    if _PAGE_LABEL_RE.search(key):
+        # "Page 3 of 40" and "Page 4 of 40" share a key
+        return _DIGITS_RE.sub("#", key)
+    if not _LETTER_RE.search(key):
+        bare = _BARE_NUMBER_RE.match(key)
+        # A bare number is a page number only if it tracks the page index ("3" on the
+        # third page, "4" on the fourth); table cells like "903" and "1035" do not
+        return f"#page{int(bare.group(1)) - page_no}" if bare else None
+    return key
+
+
+def _candidate(position: int, count: int, line: str) -> bool:
+    return position < EDGE_LINES or position >= count - EDGE_LINES or len(line) >= DISCLAIMER_MIN_CHARS
+
+
+def normalize_pages(pages: list) -> tuple:
+    """
+    Clean page texts in linear time and drop boilerplate repeated across pages.
+
+    Each page is stripped of blank lines and surrounding whitespace. Lines that
+    recur on many pages (running headers, footers, page numbers, disclaimers)
+    are kept on their first occurrence and removed everywhere else.
+
+    Returns:
+        (pages, stats) where `stats` reports the bytes and estimated tokens saved.
+    """
+    split = [[line.strip() for line in page.splitlines() if line.strip()] for page in pages]
+
+    boilerplate = set()
+    if len(split) >= BOILERPLATE_MIN_PAGES:
+        seen_on = Counter()
+        for page_no, lines in enumerate(split):
+            seen_on.update({
+                _line_key(line, page_no)
+                for pos, line in enumerate(lines)
+                if _candidate(pos, len(lines), line)
+            })
+        seen_on.pop(None, None)
+        threshold = max(BOILERPLATE_MIN_PAGES, math.ceil(BOILERPLATE_MIN_RATIO * len(split)))
+        boilerplate = {key for key, n in seen_on.items() if n >= threshold}
+
+    kept_once = set()
+    removed = 0
+    cleaned = []
+    for page_no, lines in enumerate(split):
+        out = []
+        for pos, line in enumerate(lines):
+            key = _line_key(line, page_no) if boilerplate else None
+            if key in boilerplate and _candidate(pos, len(lines), line):
+                if key in kept_once:
+                    removed += 1
+                    continue
+                kept_once.add(key)
+            out.append(line)
+        cleaned.append("\n".join(out))
+
+    raw_text = "\n".join(pages)
+    clean_text = "\n".join(cleaned)
+    bytes_in = len(raw_text.encode("utf-8"))
+    bytes_out = len(clean_text.encode("utf-8"))
+    stats = {
+        "pages": len(pages),
+        "boilerplate_patterns": len(boilerplate),
+        "lines_removed": removed,
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "bytes_saved": bytes_in - bytes_out,
+        "tokens_saved": estimate_tokens(raw_text) - estimate_tokens(clean_text),
+    }
+    return cleaned, stats
@@ -1,13 +1,69 @@
 ## Importing libraries and files
 import os
+import time
 from dotenv import load_dotenv
 load_dotenv()
 
 from crewai.tools import tool
 from crewai_tools import SerperDevTool
 
+from document_cache import extraction_cache
+from metrics import token_usage, job_metrics
+from pdf_extract import extract_pages
+from text_normalize import normalize_pages
+from retrieval import index_cache, format_passages
+from search_cache import SEARCH_BACKEND, search_cache, stub_search
+
 ## Creating search tool
-search_tool = SerperDevTool()
+class CachedSerperDevTool(SerperDevTool):
+    """
+    SerperDevTool behind a shared result cache (see search_cache.py).
+
+    Calls are recorded as tool spans of the current job, and each lookup as a
+    `search` span named hit, coalesced or miss, from which /status reports the
+    job's search-cache hit rate. With SEARCH_BACKEND=stub no API call is made.
+    """
+
+    def _run(self, **kwargs):
+        query = kwargs.get("search_query") or kwargs.get("query") or ""
+        search_type = kwargs.get("search_type", self.search_type)
+        params = {
+            "type": search_type, "n": self.n_results,
+            "country": self.country, "location": self.location, "locale": self.locale,
+        }
+        started = time.perf_counter()
+        with job_metrics.timed("tool", self.name):
+            result, outcome = search_cache.get_or_fetch(query, lambda: self._fetch(kwargs, query, search_type), params)
+        job_metrics.record("search", outcome, time.perf_counter() - started)
+        return result
+
+    def _fetch(self, kwargs: dict, query: str, search_type: str):
+        if SEARCH_BACKEND == "stub":
+            return stub_search(query, self.n_results, search_type)
+        return super()._run(**kwargs)
+
+
+search_tool = CachedSerperDevTool()
+
+
+def _extract_document(file_path: str) -> dict:
+    pages, stats = normalize_pages(extract_pages(file_path))
+    return {"pages": pages, "normalization": stats}
+
+
+def load_document(file_path: str) -> dict:
+    """
+    Return the normalised pages of a PDF plus normalisation stats.
+
+    The PDF is only parsed and cleaned on an extraction-cache miss.
+    """
+    return extraction_cache.get_or_extract(file_path, _extract_document)
+
+
+def load_document_pages(file_path: str) -> list:
+    """Return the normalised page texts of a PDF."""
+    return load_document(file_path)["pages"]
+
 
 ## Creating custom pdf reader tool using @tool decorator
 @tool("Financial Document Reader")
@@ -20,20 +76,37 @@ def read_financial_document(file_path: str = 'data/TSLA-Q2-2025-Update.pdf') ->
     Returns:
         The full text content extracted from the PDF document.
     """
-    from langchain_community.document_loaders import PyPDFLoader
+    with job_metrics.timed("tool", "Financial Document Reader"):
+        # Pages are already cleaned (blank lines and repeated headers/footers removed)
+        full_report = "\n".join(load_document_pages(file_path)) + "\n"
+
+    token_usage.record("read_financial_document", full_report)
+    return full_report
 
-    loader = PyPDFLoader(file_path=file_path)
-    docs = loader.load()
 
-    full_report = ""
-    for data in docs:
-        # Clean and format the financial document data
-        content = data.page_content
+## Creating retrieval tool over a per-document BM25 index
+@tool("Financial Document Search")
+def search_financial_document(
+    query: str,
+    file_path: str = 'data/TSLA-Q2-2025-Update.pdf',
+    top_k: int = 5,
+) -> str:
+    """Searches a financial PDF and returns only the passages relevant to the query.
 
-        # Remove extra whitespace and format properly
-        while "\n\n" in content:
-            content = content.replace("\n\n", "\n")
+    Use this instead of reading the whole document, e.g. with queries such as
+    "consolidated balance sheet", "revenue by segment" or "risk factors".
 
-        full_report += content + "\n"
+    Args:
+        query: What to look for in the document.
+        file_path: Path to the PDF file to search. Defaults to 'data/TSLA-Q2-2025-Update.pdf'.
+        top_k: Maximum number of passages to return (default 5).
 
-    return full_report
\ No newline at end of file
+    Returns:
+        The best-matching passages, each labelled with its page number and section.
+    """
+    with job_metrics.timed("tool", "Financial Document Search"):
+        pages = load_document_pages(file_path)
+        index = index_cache.get_or_build(extraction_cache.content_hash(file_path), pages)
+        passages = format_passages(index.search(query, top_k=max(1, min(int(top_k), 20))))
+    token_usage.record("search_financial_document", passages)
+    return passages
\ No newline at end of file
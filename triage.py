@@ -0,0 +1,128 @@
+## Local pre-LLM triage: score the first pages of an upload for financial-statement signals
+import os
+import re
+import time
+from dataclasses import dataclass, field
+
+from pdf_extract import iter_pages
+
+TRIAGE_ENABLED = os.getenv("TRIAGE_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+# Only the first pages are read; statements and highlights come early in filings and updates
+TRIAGE_PAGES = int(os.getenv("TRIAGE_PAGES", "6"))
+# Below: rejected without any LLM call. At or above: the LLM verification stage is skipped.
+TRIAGE_REJECT_BELOW = float(os.getenv("TRIAGE_REJECT_BELOW", "0.15"))
+TRIAGE_PASS_ABOVE = float(os.getenv("TRIAGE_PASS_ABOVE", "0.7"))
+# Fewer extractable characters than this means a scan or image-only PDF the agents cannot read
+TRIAGE_MIN_TEXT_CHARS = int(os.getenv("TRIAGE_MIN_TEXT_CHARS", "200"))
+
+_STATEMENT_HEADINGS = re.compile(
+    r"\b(balance sheets?|statements? of (financial position|operations|income|comprehensive income|"
+    r"cash flows?|(changes in )?(stockholders'?|shareholders'?) equity)|income statements?|"
+    r"cash flow statements?|profit and loss|management'?s discussion and analysis|"
+    r"notes to (the )?(consolidated )?financial statements|financial (summary|highlights)|"
+    r"results of operations|liquidity and capital resources|segment information|risk factors|"
+    r"forward[- ]looking statements|non-gaap financial measures)\b",
+    re.IGNORECASE,
+)
+_FINANCIAL_TERMS = re.compile(
+    r"\b(revenues?|net (sales|income|loss)|gross (profit|margin)|operating (income|expenses|margin)|"
+    r"earnings per share|ebitda|total assets|total liabilities|cash and cash equivalents|"
+    r"free cash flow|capital expenditures|diluted|dividends?|guidance|fiscal)\b",
+    re.IGNORECASE,
+)
+_PERIOD_PHRASES = re.compile(
+    r"\b((three|six|nine|twelve) months ended|(fiscal )?(year|quarter) ended|as of (january|february|march|"
+    r"april|may|june|july|august|september|october|november|december)|q[1-4][\s\-']*(19|20)\d{2}|"
+    r"fy\s?(19|20)?\d{2}|(first|second|third|fourth) quarter|year[- ]over[- ]year)\b",
+    re.IGNORECASE,
+)
+_CURRENCY = re.compile(r"[$€£¥]|\b(usd|eur|gbp)\b|\bin (thousands|millions|billions)\b", re.IGNORECASE)
+_AMOUNT = re.compile(r"^\(?-?[$€£¥]?\d[\d,]*(\.\d+)?\)?%?$")
+# Letter-spaced titles as some PDFs extract them ("F I N A N C I A L   S U M M A R Y")
+_SPACED_LETTERS = re.compile(r"\b(?:[A-Za-z] ){3,}[A-Za-z]\b")
+
+# Weight of each signal in the score; each signal saturates at 1. Numbers and currency
+# only count in proportion to the financial vocabulary, so receipts and price lists score low.
+_WEIGHTS = {"headings": 0.3, "terms": 0.2, "numbers": 0.2, "periods": 0.2, "currency": 0.1}
+
+
+@dataclass
+class TriageResult:
+    """Outcome of triaging one document."""
+    decision: str                       # reject | pass | uncertain
+    score: float                        # 0..1
+    seconds: float = 0.0
+    signals: dict = field(default_factory=dict)
+    reason: str = ""
+
+    def verification_report(self) -> str:
+        """Stands in for the LLM verification stage's output when triage decides on its own."""
+        found = ", ".join(self.signals.get("found_headings", [])) or "none"
+        if self.decision == "reject":
+            return (
+                f"FAIL: rejected by local document triage before any LLM call (score {self.score:.2f}). "
+                f"{self.reason} Statement headings found: {found}."
+            )
+        return (
+            f"PASS: fast-tracked by local document triage (score {self.score:.2f}). "
+            f"Statement headings found: {found}; reporting-period phrases: {self.signals.get('periods', 0)}; "
+            f"numeric token share: {self.signals.get('number_density', 0):.0%}."
+        )
+
+
+def score_text(text: str) -> tuple:
+    """Return `(score, signals)` for the financial-statement signals in `text`."""
+    text = _SPACED_LETTERS.sub(lambda m: m.group(0).replace(" ", ""), text).replace("\u2019", "'")
+    text = re.sub(r"[ \t]+", " ", text)
+    tokens = text.split()
+    headings = sorted({m.group(0).lower() for m in _STATEMENT_HEADINGS.finditer(text)})
+    terms = {m.group(0).lower() for m in _FINANCIAL_TERMS.finditer(text)}
+    periods = len(_PERIOD_PHRASES.findall(text))
+    currency = len(_CURRENCY.findall(text))
+    amounts = sum(1 for token in tokens if _AMOUNT.match(token.strip(".,;:")))
+    density = amounts / len(tokens) if tokens else 0.0
+
+    parts = {
+        "headings": min(1.0, len(headings) / 3),
+        "terms": min(1.0, len(terms) / 6),
+        "numbers": min(1.0, density / 0.15),
+        "periods": min(1.0, periods / 3),
+        "currency": min(1.0, currency / 5),
+    }
+    vocabulary = max(parts["headings"], parts["terms"])
+    parts["numbers"] *= vocabulary
+    parts["currency"] *= vocabulary
+    score = sum(_WEIGHTS[name] * value for name, value in parts.items())
+    signals = {
+        "found_headings": headings,
+        "terms": len(terms),
+        "periods": periods,
+        "currency": currency,
+        "number_density": round(density, 3),
+        "parts": {name: round(value, 2) for name, value in parts.items()},
+    }
+    return round(score, 3), signals
+
+
+def triage_document(file_path: str, pages: int = TRIAGE_PAGES) -> TriageResult:
+    """
+    Score the first `pages` pages of a PDF and decide without an LLM:
+    `reject` below TRIAGE_REJECT_BELOW, `pass` at or above TRIAGE_PASS_ABOVE,
+    `uncertain` (leave it to the verification agent) in between.
+    """
+    started = time.perf_counter()
+    text = "\n".join(iter_pages(file_path, 0, pages))
+    chars = len(text.strip())
+    if chars < TRIAGE_MIN_TEXT_CHARS:
+        score, signals = 0.0, {"text_chars": chars}
+        decision, reason = "reject", "The document has no extractable text (scanned or image-only PDF)."
+    else:
+        score, signals = score_text(text)
+        signals["text_chars"] = chars
+        if score < TRIAGE_REJECT_BELOW:
+            decision, reason = "reject", "It shows almost none of the structure of a financial report."
+        elif score >= TRIAGE_PASS_ABOVE:
+            decision, reason = "pass", ""
+        else:
+            decision, reason = "uncertain", ""
+    return TriageResult(decision, score, time.perf_counter() - started, signals, reason)
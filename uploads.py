@@ -0,0 +1,502 @@
+## Streaming multipart upload handling for the FastAPI endpoints
+import os
+import hashlib
+import zipfile
+import tempfile
+from dataclasses import dataclass, field
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+try:  # python-multipart >= 0.0.13 ships the `python_multipart` package name
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # pragma: no cover - older python-multipart
+    from multipart.multipart import MultipartParser, parse_options_header
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024           # Bytes buffered before each disk write
+MAX_FIELD_BYTES = 64 * 1024               # Cap on plain (non-file) form fields
+PDF_MAGIC = b"%PDF-"
+ZIP_MAGIC = b"PK\x03\x04"
+_SIGNATURE_BYTES = max(len(PDF_MAGIC), len(ZIP_MAGIC))
+
+# Batch submissions: file count and total bytes per request (zip members count individually)
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_MB", "2048")) * 1024 * 1024
+
+
+class UploadError(Exception):
+    """Raised when an upload is rejected; carries the HTTP status to return."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class UploadedFile:
+    """A file part that has been streamed to disk."""
+    filename: str
+    path: str
+    size: int = 0
+    sha256: str = ""
+
+
+@dataclass
+class RejectedFile:
+    """A file dropped from a batch, with the reason it was not accepted."""
+    filename: str
+    status_code: int
+    detail: str
+
+
+@dataclass
+class _Part:
+    name: str = ""
+    filename: str = None
+    headers: dict = field(default_factory=dict)
+
+
+@dataclass
+class _FileSlot:
+    filename: str
+    size: int = 0
+    head: bytes = b""
+    error: tuple = None                 # (status_code, detail) once rejected
+
+
+@dataclass
+class _Budget:
+    """Bytes and files a batch may still add while unpacking archives."""
+    bytes_left: int
+    files_left: int
+
+
+class _MemberRejected(Exception):
+    """A zip member failed validation; args are (status_code, detail)."""
+
+
+class _StreamingFormParser:
+    """
+    Incremental multipart/form-data parser.
+
+    Plain fields are collected in memory (bounded by MAX_FIELD_BYTES). Bytes of
+    file parts are queued in `pending` as (slot, chunk) pairs for the caller to
+    drain and write; size limits and the file signature are enforced as the
+    bytes arrive, so an oversized or non-PDF upload is rejected without
+    reading the rest.
+
+    In strict mode (single uploads) any rejected file aborts the request with
+    an UploadError. Otherwise (batches) the offending file is marked with its
+    error and its remaining bytes are discarded; only exceeding
+    `max_total_bytes` or `max_files` aborts the request.
+    """
+
+    def __init__(
+        self,
+        boundary: bytes,
+        file_field: str,
+        max_bytes: int,
+        max_files: int = 1,
+        max_total_bytes: int = None,
+        allow_zip: bool = False,
+        strict: bool = True,
+    ):
+        self.file_field = file_field
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_total_bytes = max_total_bytes
+        self.allow_zip = allow_zip
+        self.strict = strict
+        self.fields = {}
+        self.files = []
+        self.total_size = 0
+        self.pending = []
+        self.pending_size = 0
+
+        self._part = None
+        self._slot = None
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._value = bytearray()
+
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def write(self, chunk: bytes):
+        self._parser.write(chunk)
+
+    def finalize(self):
+        self._parser.finalize()
+        if not self.files:
+            raise UploadError(400, f"Missing file field '{self.file_field}'")
+        for slot in self.files:
+            if slot.error:
+                continue
+            if slot.size == 0:
+                self._reject(slot, 400, "Uploaded file is empty")
+            elif not self._signature_ok(slot.head, complete=True):
+                self._reject(slot, 415, "Uploaded file is not a PDF")
+
+    def take_pending(self) -> list:
+        data = self.pending
+        self.pending = []
+        self.pending_size = 0
+        return data
+
+    def _reject(self, slot: _FileSlot, status_code: int, detail: str):
+        if self.strict:
+            raise UploadError(status_code, detail)
+        slot.error = (status_code, detail)
+
+    def _signature_ok(self, head: bytes, complete: bool = False) -> bool:
+        """Whether `head` is (or, while still arriving, may become) a PDF or allowed zip signature."""
+        for magic in (PDF_MAGIC, ZIP_MAGIC) if self.allow_zip else (PDF_MAGIC,):
+            if head.startswith(magic) or (not complete and magic.startswith(head)):
+                return True
+        return False
+
+    # ------------------------------------------------------------------
+    # Parser callbacks
+    # ------------------------------------------------------------------
+    def _on_part_begin(self):
+        self._part = _Part()
+        self._slot = None
+        self._value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._part.headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._part.headers.get(b"content-disposition", b""))
+        self._part.name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        if filename is not None:
+            self._part.filename = os.path.basename(filename.decode("utf-8", "replace"))
+
+        if self._is_file_part():
+            if len(self.files) >= self.max_files:
+                if self.max_files == 1:
+                    raise UploadError(400, "Only one file may be uploaded per request")
+                raise UploadError(413, f"At most {self.max_files} files may be uploaded per request")
+            self._slot = _FileSlot(filename=self._part.filename)
+            self.files.append(self._slot)
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        chunk = data[start:end]
+        if not chunk:
+            return
+
+        if not self._is_file_part():
+            if len(self._value) + len(chunk) > MAX_FIELD_BYTES:
+                raise UploadError(413, f"Form field '{self._part.name}' is too large")
+            self._value += chunk
+            return
+
+        slot = self._slot
+        self.total_size += len(chunk)
+        if self.max_total_bytes and self.total_size > self.max_total_bytes:
+            raise UploadError(
+                413, f"Request exceeds the maximum upload size of {self.max_total_bytes // (1024 * 1024)} MB"
+            )
+        if slot.error:
+            return
+
+        slot.size += len(chunk)
+        if slot.size > self.max_bytes:
+            self._reject(
+                slot, 413, f"File exceeds the maximum upload size of {self.max_bytes // (1024 * 1024)} MB"
+            )
+            return
+
+        # Check the file signature as soon as enough bytes have arrived
+        if len(slot.head) < _SIGNATURE_BYTES:
+            slot.head += chunk[:_SIGNATURE_BYTES - len(slot.head)]
+            if not self._signature_ok(slot.head):
+                self._reject(slot, 415, "Uploaded file is not a PDF")
+                return
+
+        self.pending.append((len(self.files) - 1, chunk))
+        self.pending_size += len(chunk)
+
+    def _on_part_end(self):
+        if not self._is_file_part():
+            self.fields[self._part.name] = bytes(self._value).decode("utf-8", "replace")
+        self._part = None
+        self._slot = None
+
+    def _is_file_part(self) -> bool:
+        return (
+            self._part is not None
+            and self._part.filename is not None
+            and self._part.name == self.file_field
+        )
+
+
+def _write_chunk(f, digest, data: bytes):
+    # hashlib releases the GIL on large buffers, so hashing here is off the event loop too
+    digest.update(data)
+    f.write(data)
+
+
+class _FileWriters:
+    """Open-on-first-byte file handles for the parser's file slots, hashing as they write."""
+
+    def __init__(self, parser: _StreamingFormParser, path_for, scratch_dir: str = None):
+        self.parser = parser
+        self.path_for = path_for
+        self.scratch_dir = scratch_dir
+        self.handles = {}                   # slot -> (file, digest, path)
+
+    def write(self, pending: list):
+        for slot, data in pending:
+            entry = self.handles.get(slot)
+            if entry is None:
+                if self.parser.files[slot].head.startswith(ZIP_MAGIC):
+                    # Archives are unpacked after the upload; keep them out of the PDF namespace
+                    fd, path = tempfile.mkstemp(suffix=".zip", dir=self.scratch_dir)
+                    f = os.fdopen(fd, "wb")
+                else:
+                    path = self.path_for()
+                    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                    f = open(path, "wb")
+                entry = self.handles[slot] = (f, hashlib.sha256(), path)
+            _write_chunk(entry[0], entry[1], data)
+
+    def close(self):
+        for f, _, _ in self.handles.values():
+            f.close()
+
+    def discard(self):
+        self.close()
+        for _, _, path in self.handles.values():
+            _remove_quietly(path)
+
+
+def _multipart_boundary(request: Request, max_declared: int, too_large_detail: str) -> bytes:
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise UploadError(400, "Expected a multipart/form-data request")
+
+    # Reject before reading the body when the client declares an oversized request
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_declared:
+        raise UploadError(413, too_large_detail)
+    return options[b"boundary"]
+
+
+async def _stream_into(request: Request, parser: _StreamingFormParser, writers: _FileWriters):
+    """Feed the request body through `parser`, writing file bytes in the threadpool."""
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if parser.pending_size >= UPLOAD_CHUNK_SIZE:
+                await run_in_threadpool(writers.write, parser.take_pending())
+        parser.finalize()
+        if parser.pending_size:
+            await run_in_threadpool(writers.write, parser.take_pending())
+    except BaseException:
+        await run_in_threadpool(writers.discard)
+        raise
+    await run_in_threadpool(writers.close)
+
+
+async def receive_pdf_upload(
+    request: Request,
+    dest_path: str,
+    file_field: str = "file",
+    max_bytes: int = MAX_UPLOAD_BYTES,
+):
+    """
+    Stream a multipart upload straight to `dest_path` without buffering it in memory.
+
+    The SHA-256 of the file is computed as the chunks arrive. The upload is
+    aborted with an UploadError as soon as it exceeds `max_bytes` or its first
+    bytes are not a PDF signature; the partial file is removed in that case.
+
+    Returns:
+        (UploadedFile, fields) where `fields` holds the plain form fields.
+    """
+    boundary = _multipart_boundary(
+        request,
+        max_bytes + MAX_FIELD_BYTES,
+        f"File exceeds the maximum upload size of {max_bytes // (1024 * 1024)} MB",
+    )
+    parser = _StreamingFormParser(boundary, file_field, max_bytes)
+    writers = _FileWriters(parser, lambda: dest_path)
+    await _stream_into(request, parser, writers)
+
+    _, digest, _ = writers.handles[0]
+    uploaded = UploadedFile(
+        filename=parser.files[0].filename,
+        path=dest_path,
+        size=parser.files[0].size,
+        sha256=digest.hexdigest(),
+    )
+    return uploaded, parser.fields
+
+
+async def receive_pdf_uploads(
+    request: Request,
+    path_for,
+    file_field: str = "files",
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    max_total_bytes: int = BATCH_MAX_BYTES,
+    max_files: int = BATCH_MAX_FILES,
+    scratch_dir: str = "data",
+):
+    """
+    Stream a batch of PDFs, given as repeated `file_field` parts and/or zip archives.
+
+    Each accepted PDF is written to a fresh path from `path_for()`. Zip
+    archives are unpacked member by member after the upload; member names are
+    only used as display names, never as paths. Individual files that are too
+    large, empty or not PDFs are returned as rejected rather than failing the
+    batch. The request fails with an UploadError (and everything written is
+    removed) only when it exceeds `max_total_bytes` or `max_files`, counting
+    zip members by their uncompressed size.
+
+    Returns:
+        (accepted UploadedFiles, RejectedFiles, fields)
+    """
+    boundary = _multipart_boundary(
+        request,
+        max_total_bytes + MAX_FIELD_BYTES,
+        f"Request exceeds the maximum upload size of {max_total_bytes // (1024 * 1024)} MB",
+    )
+    os.makedirs(scratch_dir, exist_ok=True)
+    parser = _StreamingFormParser(
+        boundary, file_field, max_bytes,
+        max_files=max_files, max_total_bytes=max_total_bytes, allow_zip=True, strict=False,
+    )
+    writers = _FileWriters(parser, path_for, scratch_dir)
+    await _stream_into(request, parser, writers)
+
+    accepted, rejected, archives = [], [], []
+    for index, slot in enumerate(parser.files):
+        _, digest, path = writers.handles.get(index, (None, None, None))
+        if slot.error:
+            rejected.append(RejectedFile(slot.filename, *slot.error))
+            if path:
+                await run_in_threadpool(_remove_quietly, path)
+        elif slot.head.startswith(ZIP_MAGIC):
+            archives.append((slot.filename, path))
+        else:
+            accepted.append(UploadedFile(slot.filename, path, slot.size, digest.hexdigest()))
+
+    try:
+        budget = _Budget(max_total_bytes - sum(u.size for u in accepted), max_files - len(accepted))
+        for archive_name, zip_path in archives:
+            members, dropped = await run_in_threadpool(
+                _extract_zip, zip_path, archive_name, path_for, max_bytes, budget
+            )
+            accepted += members
+            rejected += dropped
+    except BaseException:
+        for upload in accepted:
+            await run_in_threadpool(_remove_quietly, upload.path)
+        raise
+    finally:
+        for _, zip_path in archives:
+            await run_in_threadpool(_remove_quietly, zip_path)
+
+    return accepted, rejected, parser.fields
+
+
+def _extract_zip(zip_path: str, archive_name: str, path_for, max_bytes: int, budget: _Budget):
+    """Copy the PDFs in a zip archive to fresh paths, enforcing size limits on the bytes actually read."""
+    accepted, rejected = [], []
+    try:
+        archive = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile:
+        return [], [RejectedFile(archive_name, 400, "Not a valid zip archive")]
+
+    with archive:
+        for info in archive.infolist():
+            member = info.filename.replace("\\", "/")
+            name = os.path.basename(member)
+            # Directories and OS metadata (__MACOSX/, dotfiles) are not submissions
+            if info.is_dir() or not name or name.startswith(".") or member.startswith("__MACOSX/"):
+                continue
+            label = f"{archive_name}/{member}"
+            if not name.lower().endswith(".pdf"):
+                rejected.append(RejectedFile(label, 415, "Uploaded file is not a PDF"))
+                continue
+            if info.file_size > max_bytes:
+                rejected.append(RejectedFile(
+                    label, 413, f"File exceeds the maximum upload size of {max_bytes // (1024 * 1024)} MB"
+                ))
+                continue
+            if budget.files_left <= 0:
+                for done in accepted:
+                    _remove_quietly(done.path)
+                raise UploadError(413, "Too many files in this batch")
+
+            path = path_for()
+            try:
+                upload = _copy_member(archive, info, path, name, max_bytes, budget)
+            except UploadError:
+                # The whole batch is rejected; drop what this archive already produced
+                for done in accepted + [UploadedFile(name, path)]:
+                    _remove_quietly(done.path)
+                raise
+            except (_MemberRejected, RuntimeError, zipfile.BadZipFile, NotImplementedError) as e:
+                # RuntimeError: encrypted member; NotImplementedError: unsupported compression
+                _remove_quietly(path)
+                status_code, detail = e.args if isinstance(e, _MemberRejected) else (400, f"Unreadable zip member: {e}")
+                rejected.append(RejectedFile(label, status_code, detail))
+                continue
+            budget.files_left -= 1
+            accepted.append(upload)
+    return accepted, rejected
+
+
+def _copy_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, path: str, name: str,
+                 max_bytes: int, budget: _Budget) -> UploadedFile:
+    digest = hashlib.sha256()
+    size = 0
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with archive.open(info) as src, open(path, "wb") as dst:
+        while True:
+            # Declared sizes can lie (zip bombs); count what is actually decompressed
+            data = src.read(UPLOAD_CHUNK_SIZE)
+            if not data:
+                break
+            if size == 0 and not data.startswith(PDF_MAGIC):
+                raise _MemberRejected(415, "Uploaded file is not a PDF")
+            size += len(data)
+            if size > max_bytes:
+                raise _MemberRejected(
+                    413, f"File exceeds the maximum upload size of {max_bytes // (1024 * 1024)} MB"
+                )
+            if size > budget.bytes_left:
+                raise UploadError(413, "Batch exceeds the maximum total upload size once unzipped")
+            _write_chunk(dst, digest, data)
+    if size == 0:
+        raise _MemberRejected(400, "Uploaded file is empty")
+    budget.bytes_left -= size
+    return UploadedFile(filename=name, path=path, size=size, sha256=digest.hexdigest())
+
+
+def _remove_quietly(path: str):
+    if os.path.exists(path):
+        try:
+            os.remove(path)
+        except Exception:
+            pass
@@ -1,42 +1,54 @@
 ## Celery Worker — Financial Document Analyzer
 import os
+import re
+import json
+import time
+import threading
+from dataclasses import replace
 from datetime import datetime
 from dotenv import load_dotenv
 load_dotenv()
 
-from celery import Celery
+from celery.signals import worker_process_init
+from celery.utils.log import get_task_logger
 from crewai import Crew, Process
 
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-
-# ---------------------------------------------------------------------------
-# Celery app configuration
-# ---------------------------------------------------------------------------
-celery_app = Celery(
-    "financial_analyzer",
-    broker=REDIS_URL,
-    backend=REDIS_URL,
-)
-
-celery_app.conf.update(
-    task_serializer="json",
-    accept_content=["json"],
-    result_serializer="json",
-    timezone="UTC",
-    enable_utc=True,
-    # Retry failed tasks up to 3 times with exponential back-off
-    task_acks_late=True,
-    task_reject_on_worker_lost=True,
-)
+from celery_app import celery_app, PROCESS_DOCUMENT_TASK
+from checkpoints import StageCheckpoints
+from events import publish_event, truncate_output
+from dedup import query_sha256
+from financial_metrics import extract_financial_metrics, format_for_prompt
+from metrics import current_job, current_force_refresh, current_priority, current_stage, token_usage, job_metrics
+from result_store import store_result
+from scheduler import Stage, StageRun, run_stages
+from triage import TRIAGE_ENABLED, triage_document
 
+logger = get_task_logger(__name__)
 
 # ---------------------------------------------------------------------------
 # Crew runner (imported by worker tasks; also kept here to avoid circular deps)
 # ---------------------------------------------------------------------------
-def run_crew(query: str, file_path: str = "data/TSLA-Q2-2025-Update.pdf") -> str:
-    """Instantiate and run the full 4-agent financial analysis CrewAI pipeline."""
+# Independent stages (investment + risk) run concurrently; cap the thread count here
+CREW_MAX_PARALLEL_STAGES = int(os.getenv("CREW_MAX_PARALLEL_STAGES", "2"))
+# crewai's verbose console (a live Rich tree) is process-wide and fails with "Only one live
+# display may be active at once" when crews overlap, so it defaults to on only for serial stages
+CREW_VERBOSE = os.getenv(
+    "CREW_VERBOSE", "true" if CREW_MAX_PARALLEL_STAGES <= 1 else "false"
+).strip().lower() in ("1", "true", "yes")
+if CREW_VERBOSE and CREW_MAX_PARALLEL_STAGES > 1:
+    logger.warning("CREW_VERBOSE with CREW_MAX_PARALLEL_STAGES > 1: concurrent stages share one console display")
+
+STAGE_TITLES = {
+    "verification": "Document Verification",
+    "analysis": "Financial Analysis",
+    "investment_analysis": "Investment Analysis",
+    "risk_assessment": "Risk Assessment",
+}
+
+
+def build_stages() -> list:
+    """Declare the pipeline DAG: verification -> analysis -> (investment, risk)."""
     # Lazy imports so Celery workers don't load LLM clients on module import
-    from agents import financial_analyst, verifier, investment_advisor, risk_assessor
     from task import (
         analyze_financial_document,
         verification,
@@ -44,22 +56,229 @@ def run_crew(query: str, file_path: str = "data/TSLA-Q2-2025-Update.pdf") -> str
         risk_assessment,
     )
 
-    financial_crew = Crew(
-        agents=[verifier, financial_analyst, investment_advisor, risk_assessor],
-        tasks=[verification, analyze_financial_document, investment_analysis, risk_assessment],
-        process=Process.sequential,
-        verbose=True,
+    return [
+        Stage("verification", verification),
+        Stage("analysis", analyze_financial_document, ("verification",)),
+        Stage("investment_analysis", investment_analysis, ("verification", "analysis")),
+        Stage("risk_assessment", risk_assessment, ("verification", "analysis")),
+    ]
+
+
+def verification_passed(stage: Stage, output: str) -> bool:
+    """Gate for the verification stage: stop the pipeline only on an explicit FAIL verdict."""
+    if stage.name != "verification":
+        return True
+    # Ignore the literal "PASS/FAIL" the verifier may echo from its expected output
+    verdicts = re.findall(r"\b(PASS|FAIL)(?:ED)?\b", output.replace("PASS/FAIL", ""), re.IGNORECASE)
+    verdicts = {v.upper() for v in verdicts}
+    return not ("FAIL" in verdicts and "PASS" not in verdicts)
+
+
+# ---------------------------------------------------------------------------
+# Warm crew runtimes, built once per worker process and reused across jobs
+# ---------------------------------------------------------------------------
+# false -> build the crews for every job, as before (for comparing setup overhead)
+WARM_WORKERS = os.getenv("WARM_WORKERS", "true").strip().lower() in ("1", "true", "yes")
+
+
+class CrewRuntime:
+    """
+    The pipeline stages with one single-task crew each, ready to kick off.
+
+    A runtime serves one job at a time; `reset` clears what a run leaves
+    behind on its tasks and agents so the next job starts clean.
+    """
+
+    def __init__(self, stages: list):
+        self.stages = stages
+        # One single-task crew per stage; task `context` links carry upstream outputs
+        self.crews = {
+            stage.name: Crew(
+                agents=[stage.task.agent],
+                tasks=[stage.task],
+                process=Process.sequential,
+                verbose=CREW_VERBOSE,
+            )
+            for stage in stages
+        }
+
+    def reset(self):
+        for stage in self.stages:
+            stage.task.output = None
+            agent = stage.task.agent
+            agent.tools_results = []
+            # Counts failed executions against max_retry_limit; must not carry over between jobs
+            agent._times_executed = 0
+
+
+_runtime_lock = threading.Lock()
+_prototype = None           # Never kicked off: the pristine source every warm runtime is copied from
+_idle_runtimes = []
+
+
+def _copy_stages() -> list:
+    """A private copy of the pipeline's agents and tasks, with `context` links remapped."""
+    global _prototype
+    with _runtime_lock:
+        if _prototype is None:
+            stages = build_stages()
+            agents = list({id(stage.task.agent): stage.task.agent for stage in stages}.values())
+            _prototype = (stages, Crew(agents=agents, tasks=[stage.task for stage in stages], verbose=CREW_VERBOSE))
+    stages, crew = _prototype
+    copy = crew.copy()
+    return [replace(stage, task=task) for stage, task in zip(stages, copy.tasks)]
+
+
+def acquire_runtime() -> CrewRuntime:
+    """
+    Take an idle warm runtime, building one if every runtime is busy (jobs
+    running concurrently in a threaded worker each get their own).
+    """
+    if not WARM_WORKERS:
+        return CrewRuntime(build_stages())
+    with _runtime_lock:
+        if _idle_runtimes:
+            return _idle_runtimes.pop()
+    return CrewRuntime(_copy_stages())
+
+
+def release_runtime(runtime: CrewRuntime):
+    if not WARM_WORKERS:
+        return
+    runtime.reset()
+    with _runtime_lock:
+        _idle_runtimes.append(runtime)
+
+
+@worker_process_init.connect
+def warm_up(**kwargs):
+    """Load the LLM client, tools, agents and crews when a worker process starts."""
+    if not WARM_WORKERS:
+        return
+    started = time.perf_counter()
+    try:
+        release_runtime(acquire_runtime())
+    except Exception:
+        # Not fatal: the first job builds the runtime instead
+        logger.exception("Could not warm up the crew runtime")
+        return
+    logger.info("Crew runtime ready in %.2fs", time.perf_counter() - started)
+
+
+def _execute_stage(runtime: CrewRuntime, stage: Stage, inputs: dict) -> str:
+    # Tools attribute the document tokens they return to this stage
+    current_stage.set(stage.name)
+    with job_metrics.timed("task", stage.name):
+        return str(runtime.crews[stage.name].kickoff(inputs))
+
+
+def run_pipeline(
+    query: str,
+    file_path: str = "data/TSLA-Q2-2025-Update.pdf",
+    financial_metrics: dict = None,
+    checkpoints: StageCheckpoints = None,
+    verification: str = None,
+) -> StageRun:
+    """
+    Run the 4-agent pipeline through the stage scheduler and return outputs + timings.
+
+    With `checkpoints`, each stage's output is saved as it completes, and stages
+    saved by an earlier attempt are not rerun: their outputs are restored onto
+    the tasks so downstream stages receive them as context.
+
+    A `verification` verdict (from document triage) replaces the verification
+    agent: a FAIL skips every stage, a PASS goes straight to the analysis.
+    """
+    completed = checkpoints.load() if checkpoints else {}
+    if verification is not None:
+        completed["verification"] = verification
+    inputs = {
+        "query": query,
+        "file_path": file_path,
+        "financial_metrics": format_for_prompt(financial_metrics or {}),
+    }
+    job_id = current_job.get()
+    # Per-job setup overhead: near zero once the process holds a warm runtime
+    with job_metrics.timed("step", "crew_setup"):
+        runtime = acquire_runtime()
+    for stage in runtime.stages:
+        if stage.name in completed:
+            _restore_output(stage, completed[stage.name])
+            event = "stage_triaged" if verification is not None and stage.name == "verification" else "stage_resumed"
+            publish_event(job_id, event, stage=stage.name)
+
+    def on_complete(stage, output, seconds):
+        if checkpoints:
+            checkpoints.save(stage.name, output, seconds)
+        publish_event(
+            job_id, "stage_completed", stage=stage.name, seconds=round(seconds, 3), **truncate_output(output)
+        )
+
+    try:
+        return run_stages(
+            runtime.stages,
+            lambda stage: _execute_stage(runtime, stage, inputs),
+            gate=verification_passed,
+            max_workers=CREW_MAX_PARALLEL_STAGES,
+            on_start=lambda stage: publish_event(job_id, "stage_started", stage=stage.name),
+            on_complete=on_complete,
+            on_skip=lambda stage: publish_event(job_id, "stage_skipped", stage=stage.name),
+            completed=completed,
+        )
+    finally:
+        release_runtime(runtime)
+
+
+def _restore_output(stage: Stage, output: str):
+    """Put a checkpointed output back on the stage's task, where dependent tasks read their context."""
+    from crewai.tasks.task_output import TaskOutput
+
+    stage.task.output = TaskOutput(
+        description=stage.task.description,
+        name=stage.task.name,
+        expected_output=stage.task.expected_output,
+        raw=output,
+        agent=stage.task.agent.role,
     )
 
-    result = financial_crew.kickoff({"query": query, "file_path": file_path})
-    return str(result)
+
+def format_report(run: StageRun) -> str:
+    """Assemble the stage outputs into a single report, in pipeline order."""
+    sections = [
+        f"## {title}\n\n{run.outputs[name]}"
+        for name, title in STAGE_TITLES.items()
+        if name in run.outputs
+    ]
+    if run.skipped:
+        sections.append(
+            "## Analysis Stopped\n\nThe document failed verification, so the following "
+            f"stages were skipped: {', '.join(run.skipped)}."
+        )
+    return "\n\n".join(sections)
+
+
+def run_crew(query: str, file_path: str = "data/TSLA-Q2-2025-Update.pdf") -> str:
+    """Instantiate and run the full 4-agent financial analysis CrewAI pipeline."""
+    return format_report(run_pipeline(query=query, file_path=file_path))
+
+
+def _sync_linked_jobs(db, job):
+    """Mirror a job's status onto submissions that joined it via deduplication."""
+    from database import AnalysisJob
+
+    db.query(AnalysisJob).filter(AnalysisJob.source_job_id == job.id).update(
+        {"status": job.status, "completed_at": job.completed_at},
+        synchronize_session=False,
+    )
 
 
 # ---------------------------------------------------------------------------
 # Celery task
 # ---------------------------------------------------------------------------
-@celery_app.task(bind=True, name="process_financial_document", max_retries=3)
-def process_financial_document_task(self, job_id: str, query: str, file_path: str):
+@celery_app.task(bind=True, name=PROCESS_DOCUMENT_TASK, max_retries=3)
+def process_financial_document_task(
+    self, job_id: str, query: str, file_path: str, priority: int = 0, force_refresh: bool = False,
+):
     """
     Background task that runs the CrewAI pipeline and persists results to DB.
 
@@ -67,42 +286,135 @@ def process_financial_document_task(self, job_id: str, query: str, file_path: st
         job_id:    UUID of the AnalysisJob record in the database.
         query:     User-provided analysis query.
         file_path: Path to the uploaded PDF file on disk.
+        priority:  LLM rate-limiter priority of this job (higher is served first).
+        force_refresh: Submitted with force_refresh; LLM responses are not served from the cache.
     """
     from database import SessionLocal, AnalysisJob
 
     db = SessionLocal()
     job = None
+    checkpoints = None
+    retrying = False
+    current_job.set(job_id)
+    current_priority.set(priority)
+    current_force_refresh.set(force_refresh)
+    started = time.perf_counter()
 
     try:
         job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
         if job:
+            if job.created_at and not self.request.retries:
+                job_metrics.record("queue", "wait", (datetime.utcnow() - job.created_at).total_seconds())
             job.status = "processing"
+            _sync_linked_jobs(db, job)
             db.commit()
+        publish_event(job_id, "status", status="processing", attempt=self.request.retries + 1)
+
+        from document_cache import extraction_cache
+
+        # Score the first pages locally: clear non-financial uploads never reach an LLM,
+        # clear financial ones skip the verification agent
+        triage = None
+        if TRIAGE_ENABLED:
+            with job_metrics.timed("step", "triage"):
+                triage = triage_document(file_path)
+            if job:
+                job.triage_decision = triage.decision
+                job.triage_score = triage.score
+                job.triage_ms = triage.seconds * 1000
+                db.commit()
+            publish_event(
+                job_id, "triage", decision=triage.decision, score=triage.score, ms=round(triage.seconds * 1000, 1)
+            )
+        verification = triage.verification_report() if triage and triage.decision != "uncertain" else None
 
-        result = run_crew(query=query, file_path=file_path)
+        if triage and triage.decision == "reject":
+            document_stats = {}
+            with job_metrics.timed("step", "crew"):
+                run = run_pipeline(query=query, file_path=file_path, verification=verification)
+        else:
+            # Parse + normalise once up front; every agent tool call then hits the cache
+            from tools import load_document
+            with job_metrics.timed("step", "load_document"):
+                document = load_document(file_path)
+            document_stats = document["normalization"]
+            checkpoints = StageCheckpoints(
+                job_id,
+                (job.document_hash if job else None) or extraction_cache.content_hash(file_path),
+                query_sha256(query),
+            )
+            publish_event(job_id, "document_loaded", pages=document_stats.get("pages"))
+            logger.info("Job %s document normalisation: %s", job_id, document_stats)
+
+            # Deterministic figures are stored before the crew runs, so they survive LLM failures
+            with job_metrics.timed("step", "extract_financial_metrics"):
+                figures = extract_financial_metrics(document["pages"])
+            if job:
+                with job_metrics.timed("step", "db_write"):
+                    job.financial_metrics = json.dumps(figures)
+                    db.commit()
+            publish_event(job_id, "financials_extracted", metrics=sorted(figures.get("source_pages", {})))
+
+            with job_metrics.timed("step", "crew"):
+                run = run_pipeline(
+                    query=query, file_path=file_path, financial_metrics=figures,
+                    checkpoints=checkpoints, verification=verification,
+                )
+        timings = run.timing_report()
+        tokens = token_usage.pop_job(job_id)
+        logger.info("Job %s stage timings: %s; document tokens: %s", job_id, timings, tokens)
 
         if job:
-            job.status = "completed"
-            job.result = result
-            job.completed_at = datetime.utcnow()
-            db.commit()
+            with job_metrics.timed("step", "db_write"):
+                job.status = "completed"
+                store_result(job, format_report(run))
+                job.stage_timings = json.dumps(timings)
+                job.token_usage = json.dumps(tokens)
+                job.document_stats = json.dumps(document_stats)
+                job.completed_at = datetime.utcnow()
+                _sync_linked_jobs(db, job)
+                db.commit()
+        publish_event(job_id, "completed", status="completed", stage_timings=timings)
 
-        return {"status": "completed", "job_id": job_id}
+        from search_cache import search_cache
+        return {
+            "status": "completed",
+            "job_id": job_id,
+            "stage_timings": timings,
+            "token_usage": tokens,
+            "document_stats": document_stats,
+            "extraction_cache": extraction_cache.stats(),
+            "search_cache": search_cache.stats(),
+        }
 
     except Exception as exc:
         if job:
             job.status = "failed"
             job.error = str(exc)
             job.completed_at = datetime.utcnow()
+            _sync_linked_jobs(db, job)
             db.commit()
+        retrying = self.request.retries < self.max_retries
+        publish_event(job_id, "failed", status="failed", error=str(exc), retrying=retrying)
         # Retry with exponential back-off (10s, 20s, 40s)
         raise self.retry(exc=exc, countdown=10 * (2 ** self.request.retries))
 
     finally:
+        token_usage.pop_job(job_id)
+        job_metrics.record("job", "process_financial_document", time.perf_counter() - started)
+        try:
+            db.rollback()
+            job_metrics.flush(db, job_id)
+        except Exception:
+            logger.exception("Job %s: could not store timing metrics", job_id)
+            job_metrics.pop_job(job_id)
         db.close()
-        # Clean up the temporary uploaded file
-        if os.path.exists(file_path) and "financial_document_" in file_path:
-            try:
-                os.remove(file_path)
-            except Exception:
-                pass
+        # A retry needs the upload and resumes from the checkpoints; otherwise both are done with
+        if not retrying:
+            if checkpoints:
+                checkpoints.clear()
+            if os.path.exists(file_path) and "financial_document_" in file_path:
+                try:
+                    os.remove(file_path)
+                except Exception:
+                    pass